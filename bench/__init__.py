@@ -0,0 +1,2 @@
+# benchmarks of the cifers, folder locking, the storage and rendering on synthetic storages;
+# run `python -m bench --help` from the repository root
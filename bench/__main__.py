@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import importlib.metadata
+import io
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import crypt_tools
+from crypt_tools import VigenereCipher, VigenereIterShiftCifer, VigenereKeySplitCifer
+from obj import App, Entry
+from bench.synth import make_folders, random_text, write_storage
+
+
+def timed(fn, repeat: int, setup=None) -> dict:
+    # runs fn repeat times (setup, if given, before every run and outside of the timing)
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        fn(arg) if setup is not None else fn()
+        times.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'runs': repeat}
+
+
+def bench_cifers(args, results: dict) -> None:
+    text = random_text(random.Random(args.seed), args.cipher_chars)
+    cifers = {
+        'VigenereCipher': VigenereCipher(),
+        'VigenereIterShiftCifer': VigenereIterShiftCifer(iterations=100),
+        'VigenereKeySplitCifer': VigenereKeySplitCifer(iterations=100),
+    }
+    fields = [text[i:i+args.field_len] for i in range(0, len(text), args.field_len)]
+    # the caches are wiped before every run, so these are the uncached throughputs
+    for name, cifer in cifers.items():
+        res = timed(lambda _: cifer.encrypt(text, args.key), args.repeat, crypt_tools.wipe_caches)
+        res['chars_per_s'] = len(text) / res['median_s']
+        results[f'cipher.{name}.encrypt'] = res
+        res = timed(lambda _: cifer.encrypt_batch(fields, args.key), args.repeat, crypt_tools.wipe_caches)
+        res['chars_per_s'] = len(text) / res['median_s']
+        res['fields'] = len(fields)
+        results[f'cipher.{name}.encrypt_batch'] = res
+
+
+def bench_folder(args, results: dict) -> None:
+    # one locked and one unlocked folder of the configured size; every run works on a fresh copy
+    locked = pickle.dumps(make_folders(1, args.entries, args.field_len, 0, args.key, args.seed)['folder0'])
+    unlocked = pickle.dumps(make_folders(1, args.entries, args.field_len, 0, None, args.seed)['folder0'])
+
+    def fresh(data: bytes):
+        crypt_tools.wipe_caches()
+        return pickle.loads(data)
+
+    results['folder.encrypt'] = timed(lambda db: db.encrypt(args.key), args.repeat, lambda: fresh(unlocked))
+    results['folder.decrypt'] = timed(lambda db: db.decrypt(args.key), args.repeat, lambda: fresh(locked))
+    results['folder.decrypt_lazy'] = timed(
+        lambda db: db.decrypt(args.key, lazy=True), args.repeat, lambda: fresh(locked)
+    )
+    # a lock/unlock cycle with the same key: the second half finds every field in the result cache. Only the
+    # pure python path uses that cache, so these always run without numpy
+    crypt_tools.wipe_caches()
+    crypt_tools.USE_NUMPY = False
+    try:
+        results['folder.encrypt_cached'] = timed(
+            lambda db: db.encrypt(args.key), args.repeat, lambda: pickle.loads(unlocked)
+        )
+        results['folder.decrypt_cached'] = timed(
+            lambda db: db.decrypt(args.key), args.repeat, lambda: pickle.loads(locked)
+        )
+    finally:
+        crypt_tools.USE_NUMPY = True
+    for name in ('encrypt', 'decrypt', 'decrypt_lazy', 'encrypt_cached', 'decrypt_cached'):
+        results[f'folder.{name}']['entries'] = args.entries
+    results['folder.encrypt_cached']['numpy'] = results['folder.decrypt_cached']['numpy'] = False
+
+
+def open_app(path: str) -> App:
+    return App(path, interactive=False)
+
+
+def bench_storage(args, results: dict, path: str) -> None:
+    dbs = make_folders(args.folders, args.entries, args.field_len, args.log_len, args.key, args.seed)
+    size = write_storage(path, dbs, args.codec, args.level)
+    apps = []
+
+    def load() -> None:
+        apps.append(open_app(path))
+
+    def load_all() -> None:
+        app = open_app(path)
+        apps.append(app)
+        app.databases.decode_all()
+
+    results['storage.load'] = timed(load, args.repeat)
+    results['storage.load']['bytes'] = size
+    results['storage.load_all_folders'] = timed(load_all, args.repeat)
+    for app in apps:
+        app.close()
+
+    app = open_app(path)
+    app.interactive = True # save right away instead of once at the end of a batch
+    app.execute(f'unlock {args.key}')
+
+    def save_snapshot() -> None:
+        app.storage.known = None # forces a full snapshot
+        app.save()
+        app.saver.wait()
+
+    def save_journal() -> None:
+        app.databases['folder0'].add_entry(Entry('bench', 'login', 'password'))
+        app.save()
+        app.saver.wait()
+
+    results['storage.save_snapshot'] = timed(save_snapshot, args.repeat)
+    results['storage.save_journal'] = timed(save_journal, args.repeat)
+    # listv shows one page at a time, so the limit makes it render every entry (including the ones added above)
+    total = sum(len(db.entries) for db in app.databases.values())
+    results['render.listv'] = timed(lambda: app.execute(f'listv --limit {total}'), args.repeat)
+    results['render.listv']['entries'] = total
+    app.close()
+
+
+def environment() -> dict:
+    try:
+        rich_version = importlib.metadata.version('rich')
+    except importlib.metadata.PackageNotFoundError:
+        rich_version = None
+    np = crypt_tools.load_numpy()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__ if np is not None else None,
+        'rich': rich_version,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the cifers, folder locking, the storage and rendering')
+    parser.add_argument('--folders', type=int, default=10)
+    parser.add_argument('--entries', type=int, default=1000, help='entries per folder')
+    parser.add_argument('--field-len', type=int, default=16, help='length of logins, passwords and notes')
+    parser.add_argument('--log-len', type=int, default=100, help='log records per folder')
+    parser.add_argument('--cipher-chars', type=int, default=100000, help='length of the text for the cifer benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--key', default='bench5Key')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--codec', choices=('none', 'zlib', 'lzma'), default='none', help='compression of the storage')
+    parser.add_argument('--level', type=int, help='compression level (0..9)')
+    parser.add_argument('--only', choices=('cipher', 'folder', 'storage'), action='append',
+                        help='run only these groups (may be repeated)')
+    parser.add_argument('--out', help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    groups = args.only or ['cipher', 'folder', 'storage']
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # the app prints to stdout, so it is silenced while the benchmarks run
+        if 'cipher' in groups:
+            bench_cifers(args, results)
+        if 'folder' in groups:
+            bench_folder(args, results)
+        if 'storage' in groups:
+            bench_storage(args, results, os.path.join(tmp, 'bench.pass'))
+    config = {k: v for k, v in vars(args).items() if k not in ('out', 'only')}
+    report = {'config': config, 'environment': environment(), 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
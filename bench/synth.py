@@ -0,0 +1,64 @@
+import argparse
+import random
+import time
+
+from obj import Entry, Folder
+from storage import FolderIndex, JournalStorage
+from utils import SYM_forw
+
+LOG_ACTIONS = ('decrypted', 'encrypted', 'added entry', 'deleted entry', 'decrypting unsuccessfull')
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choices(SYM_forw, k=length))
+
+
+def make_folders(folders: int, entries: int, field_len: int = 16, log_len: int = 0,
+                 key: str | None = None, seed: int = 0) -> dict[str, Folder]:
+    # builds folders x entries synthetic entries with login, password and note of field_len characters
+    # and log_len log records per folder; the folders are locked with key if it is given
+    rng = random.Random(seed)
+    start = time.time() - 86400 * 365
+    dbs = {}
+    for i in range(folders):
+        db = Folder(f'folder{i}')
+        for j in range(entries):
+            db.entries.append(Entry(f'entry{j}', random_text(rng, field_len), random_text(rng, field_len), random_text(rng, field_len)))
+        for j in range(log_len):
+            action = rng.choice(LOG_ACTIONS)
+            arg = f'entry{rng.randrange(max(entries, 1))}' if action.endswith('entry') else None
+            db.log_history.append(start + j, action, arg)
+        if key is not None:
+            db.encrypt(key)
+        db.pop_changes()
+        dbs[db.name] = db
+    return dbs
+
+
+def write_storage(path: str, dbs: dict[str, Folder], codec: str = 'none', level: int | None = None) -> int:
+    # writes the folders as a fresh indexed snapshot (no journal) and returns its size in bytes
+    storage = JournalStorage(path)
+    storage.set_codec(codec, level)
+    storage.compact(FolderIndex(dbs))
+    return storage.snapshot_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Write a synthetic storage')
+    parser.add_argument('path', help='storage file to write, e.g. big.pass')
+    parser.add_argument('--folders', type=int, default=10)
+    parser.add_argument('--entries', type=int, default=1000, help='entries per folder')
+    parser.add_argument('--field-len', type=int, default=16, help='length of logins, passwords and notes')
+    parser.add_argument('--log-len', type=int, default=100, help='log records per folder')
+    parser.add_argument('--key', help='lock all folders with this key')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--codec', choices=('none', 'zlib', 'lzma'), default='none', help='compression of the storage')
+    parser.add_argument('--level', type=int, help='compression level (0..9)')
+    args = parser.parse_args()
+    dbs = make_folders(args.folders, args.entries, args.field_len, args.log_len, args.key, args.seed)
+    size = write_storage(args.path, dbs, args.codec, args.level)
+    print(f'Wrote {args.folders * args.entries} entries in {args.folders} folders to {args.path} ({size} bytes)')
+
+
+if __name__ == '__main__':
+    main()
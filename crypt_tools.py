@@ -1,21 +1,238 @@
+from abc import ABC, abstractmethod
+import importlib.util
+from collections import OrderedDict
+from math import lcm
+
 from utils import *
 
+# numpy is optional and slow to import, so it is only imported by the first batch (see load_numpy);
+# without it (or with USE_NUMPY = False) batches fall back to the per-string path
+USE_NUMPY = True
+_np = None # the numpy module once imported, False if it is not installed
+
+
+def apply_keystream(s: str, stream: list[int], sign: int = 1) -> str:
+    # shifts every character of s by the periodic keystream (sign=1 encrypts, sign=-1 decrypts) in a single pass
+    if not s:
+        return s
+    n = len(SYM_forw)
+    period = len(stream)
+    backw = VigenereCipher._backw
+    return ''.join(
+        SYM_forw[(backw(ch) + sign * stream[i % period]) % n] for i, ch in enumerate(s)
+    )
+
+
+def load_numpy():
+    # the numpy module for the batch path (imported on the first call) or None if it is not used
+    global _np, _FORW_CODES, _BACKW_LUT
+    if not USE_NUMPY or _np is False:
+        return None
+    if _np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            _np = False
+            return None
+        # code point -> index in SYM_forw (255 marks an unknown character) and back
+        _FORW_CODES = np.array([ord(ch) for ch in SYM_forw], dtype=np.uint32)
+        _BACKW_LUT = np.full(int(_FORW_CODES.max()) + 1, 255, dtype=np.uint8)
+        _BACKW_LUT[_FORW_CODES] = np.arange(len(SYM_forw), dtype=np.uint8)
+        _np = np
+    return _np
+
+
+def has_numpy() -> bool:
+    # whether batches take the numpy path, without importing numpy
+    if not USE_NUMPY or _np is False:
+        return False
+    return _np is not None or importlib.util.find_spec('numpy') is not None
+
+
+def apply_keystream_batch(strings: list[str], stream: list[int], sign: int = 1) -> list[str]:
+    # same as apply_keystream for every string of the list, but done with one vectorized pass over all of them
+    np = load_numpy()
+    if np is None:
+        return [apply_keystream(s, stream, sign) for s in strings]
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    total = int(lengths.sum())
+    if total == 0:
+        return list(strings)
+    codes = np.frombuffer(''.join(strings).encode('utf-32-le'), dtype=np.uint32)
+    ind = np.full(total, 255, dtype=np.uint8)
+    known = codes < len(_BACKW_LUT)
+    ind[known] = _BACKW_LUT[codes[known]]
+    if (ind == 255).any():
+        bad = chr(codes[np.argmax(ind == 255)])
+        raise KeyError(f'Character {bad} is unknown')
+    # position of every character inside its own string, so that each string starts at the beginning of the stream
+    starts = np.cumsum(lengths) - lengths
+    pos = np.arange(total, dtype=np.int64) - np.repeat(starts, lengths)
+    shifts = np.asarray(stream, dtype=np.int64)[pos % len(stream)]
+    res = (ind.astype(np.int64) + sign * shifts) % len(SYM_forw)
+    joined = _FORW_CODES[res].tobytes().decode('utf-32-le')
+    ends = (starts + lengths).tolist()
+    return [joined[a:b] for a, b in zip(starts.tolist(), ends)]
+
+
+class CipherCounters:
+    # how much work the cifers did: calls, strings and characters per direction, keystreams built and
+    # the number of plain Vigenere passes over a string that these keystreams stand for
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = {'encrypt': 0, 'decrypt': 0}
+        self.strings = {'encrypt': 0, 'decrypt': 0}
+        self.chars = {'encrypt': 0, 'decrypt': 0}
+        self.keystreams = 0
+        self.passes = 0
+
+    def add(self, direction: str, strings: int, chars: int, passes: int) -> None:
+        self.calls[direction] += 1
+        self.strings[direction] += strings
+        self.chars[direction] += chars
+        self.passes += passes * strings
+
+
+counters = CipherCounters()
+
+KEYSTREAM_CACHE_SIZE = 16 # keys
+RESULT_CACHE_SIZE = 65536 # (key, string) pairs
+RESULT_CACHE_MAX_LEN = 256 # longer strings are not worth keeping (fields are much shorter)
+
+
+class LRUCache:
+    # bounded mapping that evicts the least recently used item
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value) -> None:
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self) -> None:
+        self.items.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# keystreams by (cifer, key) and results by (cifer, key, sign, string); they hold keys and plaintext,
+# so the application wipes them when it is closed. The counters only count the strings that missed the cache
+keystream_cache = LRUCache(KEYSTREAM_CACHE_SIZE)
+result_cache = LRUCache(RESULT_CACHE_SIZE)
 
-class VigenereCipher:
-    def encrypt(self, s, key):
-        pr = string_repeater(key)
-        res = ''
-        for ch in s:
-            res += self._forw((self._backw(ch) + self._backw(next(pr))) % len(SYM_forw))
-        return res
 
-    def decrypt(self, s, key):
-        pr = string_repeater(key)
-        res = ''
-        for ch in s:
-            res += self._forw((self._backw(ch) - self._backw(next(pr))) % len(SYM_forw))
+def wipe_caches() -> None:
+    keystream_cache.clear()
+    result_cache.clear()
+
+
+class KeystreamCifer(ABC):
+    # base class of the cifers: subclasses only define how a key turns into a periodic keystream
+    # and how many plain Vigenere passes that keystream combines
+    @abstractmethod
+    def keystream(self, key: str) -> list[int]:
+        ...
+
+    def passes(self, key: str) -> int:
+        return 1
+
+    def params(self) -> tuple:
+        # identifies the cifer in the cache keys; cifers with the same parameters produce the same results
+        return type(self).__name__, getattr(self, 'iterations', None)
+
+    def cached_keystream(self, key: str) -> list[int]:
+        cache_key = (self.params(), key)
+        stream = keystream_cache.get(cache_key)
+        if stream is None:
+            stream = self.keystream(key)
+            counters.keystreams += 1
+            keystream_cache.put(cache_key, stream)
+        return stream
+
+    def _apply(self, s: str, key: str, sign: int) -> str:
+        if len(s) > RESULT_CACHE_MAX_LEN:
+            counters.add('encrypt' if sign == 1 else 'decrypt', 1, len(s), self.passes(key))
+            return apply_keystream(s, self.cached_keystream(key), sign)
+        res = result_cache.get((self.params(), key, sign, s))
+        if res is None:
+            counters.add('encrypt' if sign == 1 else 'decrypt', 1, len(s), self.passes(key))
+            res = apply_keystream(s, self.cached_keystream(key), sign)
+            self._remember(key, sign, s, res)
         return res
-    
+
+    def _remember(self, key: str, sign: int, s: str, res: str) -> None:
+        # the inverse pair is stored too, so that locking a folder with the key it was unlocked with is a lookup
+        params = self.params()
+        result_cache.put((params, key, sign, s), res)
+        result_cache.put((params, key, -sign, res), s)
+
+    def _apply_batch(self, strings: list[str], key: str, sign: int, cache: bool = True) -> list[str]:
+        # the vectorized path shifts a field faster than the cache could look it up, so only the pure python
+        # path uses the result cache: repeated strings (shared logins, empty notes) and strings seen in earlier
+        # calls are only looked up, the rest is shifted in one batch. cache=False bypasses the result cache
+        # (for plaintext that should not stay in memory)
+        if not cache or load_numpy() is not None:
+            counters.add('encrypt' if sign == 1 else 'decrypt', len(strings), sum(map(len, strings)), self.passes(key))
+            return apply_keystream_batch(strings, self.cached_keystream(key), sign)
+        params = self.params()
+        known = {}
+        missing = []
+        for s in dict.fromkeys(strings):
+            res = result_cache.get((params, key, sign, s)) if len(s) <= RESULT_CACHE_MAX_LEN else None
+            if res is None:
+                missing.append(s)
+            else:
+                known[s] = res
+        if missing:
+            counters.add('encrypt' if sign == 1 else 'decrypt', len(missing), sum(map(len, missing)), self.passes(key))
+            for s, res in zip(missing, apply_keystream_batch(missing, self.cached_keystream(key), sign)):
+                known[s] = res
+                if len(s) <= RESULT_CACHE_MAX_LEN:
+                    self._remember(key, sign, s, res)
+        return [known[s] for s in strings]
+
+    def encrypt(self, s: str, key: str) -> str:
+        if not s:
+            return s
+        return self._apply(s, key, 1)
+
+    def decrypt(self, s: str, key: str) -> str:
+        if not s:
+            return s
+        return self._apply(s, key, -1)
+
+    def encrypt_batch(self, strings: list[str], key: str, cache: bool = True) -> list[str]:
+        if not any(strings):
+            return list(strings)
+        return self._apply_batch(strings, key, 1, cache)
+
+    def decrypt_batch(self, strings: list[str], key: str, cache: bool = True) -> list[str]:
+        if not any(strings):
+            return list(strings)
+        return self._apply_batch(strings, key, -1, cache)
+
+
+class VigenereCipher(KeystreamCifer):
+    @staticmethod
+    def keystream(key: str) -> list[int]:
+        return [VigenereCipher._backw(ch) for ch in key]
+
     @staticmethod
     def _forw(ind: int):
         return SYM_forw[ind]
@@ -27,26 +244,27 @@ class VigenereCipher:
         return SYM_backw[ch]
 
 
-class VigenereIterShiftCifer:
+class VigenereIterShiftCifer(KeystreamCifer):
     def __init__(self, iterations=10) -> None:
         self.iterations = iterations
 
-    def encrypt(self, s, key):
-        tmp = s
-        cifer = VigenereCipher()
-        for i in range(self.iterations):
-            tmp = cifer.encrypt(tmp, shift_str(key, i))
-        return tmp
-    
-    def decrypt(self, s, key):
-        tmp = s
-        cifer = VigenereCipher()
-        for i in reversed(range(self.iterations)):
-            tmp = cifer.decrypt(tmp, shift_str(key, i))
-        return tmp
-
-
-class VigenereKeySplitCifer:
+    def passes(self, key: str) -> int:
+        return self.iterations
+
+    def keystream(self, key: str) -> list[int]:
+        # the i-th pass shifts the key by i, so position p accumulates key[p], key[p-1], ..., key[p-iterations+1];
+        # full turns over the key add sum(key) each, only the remainder has to be summed explicitly
+        base = VigenereCipher.keystream(key)
+        L = len(base)
+        full, rest = divmod(self.iterations, L)
+        total = full * sum(base)
+        return [
+            (total + sum(base[(p - j) % L] for j in range(rest))) % len(SYM_forw)
+            for p in range(L)
+        ]
+
+
+class VigenereKeySplitCifer(KeystreamCifer):
     def __init__(self, iterations=10) -> None:
         self.iterations = iterations
 
@@ -60,18 +278,15 @@ class VigenereKeySplitCifer:
             extra = key[1]
         return [key[:mid+1], key[mid+1:] + extra]
 
-    def encrypt(self, s: str, key: str) -> str:
-        keys = VigenereKeySplitCifer.split_key_2(key)
-        tmp = s
-        cifer = VigenereIterShiftCifer(self.iterations)
-        for k in keys:
-            tmp = cifer.encrypt(tmp, k)
-        return tmp
+    def passes(self, key: str) -> int:
+        return self.iterations * len(VigenereKeySplitCifer.split_key_2(key))
 
-    def decrypt(self, s: str, key: str) -> str:
-        keys = VigenereKeySplitCifer.split_key_2(key)
-        tmp = s
+    def keystream(self, key: str) -> list[int]:
+        # the per-key streams add up, so the composite stream repeats with the lcm of the split key lengths
         cifer = VigenereIterShiftCifer(self.iterations)
-        for k in reversed(keys):
-            tmp = cifer.decrypt(tmp, k)
-        return tmp
+        streams = [cifer.keystream(k) for k in VigenereKeySplitCifer.split_key_2(key)]
+        period = lcm(*(len(st) for st in streams))
+        return [
+            sum(st[p % len(st)] for st in streams) % len(SYM_forw)
+            for p in range(period)
+        ]
@@ -0,0 +1,95 @@
+import cProfile
+import io
+import pstats
+from bisect import bisect_left
+
+
+# upper bounds (in seconds) of the latency buckets; the last bucket takes everything slower
+BUCKETS = (0.001, 0.003, 0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0)
+BUCKET_LABELS = tuple(f'<{b * 1000:g}ms' if b < 1 else f'<{b:g}s' for b in BUCKETS) + (f'>={BUCKETS[-1]:g}s',)
+ALIASES = {'f': 'folder', 'l': 'lock', 'ul': 'unlock'}
+FOLDER_ALIASES = {'+': 'add', 'l': 'list', '<<': 'lock', '>>': 'unlock', 'ul': 'unlock'}
+PROFILE_LINES = 25
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def buckets(self) -> list[tuple[str, int]]:
+        return [(label, n) for label, n in zip(BUCKET_LABELS, self.counts) if n]
+
+
+def command_name(cmd: str, commands: set[str], folder_commands: set[str]) -> str:
+    # the pattern of a command without its arguments (which may be keys), e.g. "folder unlock"
+    words = cmd.split()
+    if not words:
+        return 'unknown'
+    name = ALIASES.get(words[0], words[0])
+    if name not in commands:
+        return 'unknown'
+    if name != 'folder':
+        return name
+    if len(words) < 3:
+        return 'folder'
+    sub = FOLDER_ALIASES.get(words[2], words[2])
+    return f'folder {sub}' if sub in folder_commands else 'folder unknown'
+
+
+class CommandStats:
+    # latency histograms of the executed commands by command name
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = LatencyHistogram()
+        hist.record(seconds)
+
+    def reset(self) -> None:
+        self.histograms.clear()
+
+
+class Profiler:
+    # runs the next `remaining` commands under cProfile; the statistics add up over these commands
+    def __init__(self) -> None:
+        self.remaining = 0
+        self.out: str | None = None
+        self.profile: cProfile.Profile | None = None
+
+    def start(self, commands: int, out: str | None = None) -> None:
+        self.remaining = commands
+        self.out = out
+        self.profile = cProfile.Profile()
+
+    def stop(self) -> None:
+        self.remaining = 0
+        self.profile = None
+
+    def run(self, fn, *args) -> str | None:
+        # calls fn(*args) and returns the report if the call was profiled
+        if not self.remaining:
+            fn(*args)
+            return None
+        profile = self.profile
+        self.remaining -= 1
+        try:
+            profile.runcall(fn, *args)
+        finally:
+            if not self.remaining:
+                self.profile = None
+        if self.out is not None:
+            profile.dump_stats(self.out)
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        return stream.getvalue()
@@ -1,8 +1,42 @@
-from obj import *
+import argparse
+import sys
+
+import rich_utils as ru
+
+
+def read_commands(args: argparse.Namespace) -> list[str]:
+    # commands of --exec are separated by ';', a --script file has one command per line (# starts a comment)
+    if args.exec is not None:
+        lines = args.exec.split(';')
+    else:
+        with open(args.script) as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
 
 def main() -> None:
-    app = App()
-    app.run()
+    parser = argparse.ArgumentParser(description='CL Password Manager')
+    parser.add_argument('--storage', help='storage file to open (created if it does not exist)')
+    batch = parser.add_mutually_exclusive_group()
+    batch.add_argument('--exec', help='run the ";"-separated commands without prompting and exit')
+    batch.add_argument('--script', help='run the commands of a file (one per line) without prompting and exit')
+    parser.add_argument('--yes', action='store_true', help='answer "y" to every confirmation in batch mode')
+    args = parser.parse_args()
+
+    if args.exec is None and args.script is None:
+        from obj import App
+        App(args.storage).run()
+        return
+
+    if args.storage is None:
+        parser.error('--exec and --script need a --storage')
+    commands = read_commands(args)
+    if not sys.stdout.isatty():
+        # rich is never imported when the output goes to a pipe or a file
+        ru.use_plain_output()
+    from obj import App
+    App(args.storage, interactive=False, assume_yes=args.yes).run_batch(commands)
+
 
 if __name__ == '__main__':
     main()
@@ -1,54 +1,200 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-import pickle
+import csv
 import glob
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import islice, starmap
+from operator import attrgetter, itemgetter
 from datetime import datetime
 
-from rich.console import Console
-
 from crypt_tools import VigenereKeySplitCifer
+import crypt_tools
+from storage import JournalStorage, FolderIndex, BackgroundSaver
+import storage
 import utils
+import transfer
+import instrument
 import rich_utils as ru
 
 cifer = VigenereKeySplitCifer(iterations=100)
+PARALLEL_MIN_FIELDS = 30000 # below this many fields a process pool costs more than it saves
+LOAD_THREADS = 8 # storages loaded at once by "open"
+LIST_PAGE_SIZE = 100 # entries shown by "listv" and "folder <name> list" at a time unless --limit is given
+AUDIT_WEAK_SCORE = 0.6 # passwords scored below this by "audit" are reported as weak
+AUDIT_LIMIT = 20 # rows of each "audit" table unless --limit is given
 
 HELP_STR = [
-    'save    # save all folders to a local storage',
-    'close    # close the program',
+    'save    # save all folders to a local storage; the file is written in the background',
+    'autosave [<seconds>|off]    # show, set or disable saving automatically every <seconds> seconds',
+    'close    # close the program; waits until all saves are written',
     'help    # print this message',
     'folder <folder_name>    # create a folder',
-    'folder <folder_name> list    # list all entries in the folder',
+    'folder <folder_name> list [--page <p>] [--limit <n>]    # list the entries in the folder, 100 at a time (page <p> of <n> entries, starting at 1); everything at once when the output is not a terminal',
     'folder <folder_name> add <ent_name> <login> <password> [<notes>*]    # add a new entry to the folder; the folder must be unlocked',
     'folder <folder_name> lock <key>    # encrypt a folder with a key; the folder must be unlocked',
     'folder <folder_name> unlock <key>    # decrypt a folder with a key; executes successfully only if the key is correct; the folder must be locked',
     'folder <folder_name> drop    # delete the folder; a folder must be unlocked',
-    'folder <folder_name> drop <index>    # delete the entry with a given index from the folder; the folder must be unlocked; the entries are enumerated starting at 0',
-    'folder <folder_name> export    # write all entries of a folder into a file',
-    'folder <folder_name> info    # print log history of a folder; the folder must me unlocked',
-    'list    # list all folders in this storage',
-    'listv    # list all folders with their contents',
+    'folder <folder_name> get <entry>*    # show the entries with the given IDs or names',
+    'folder <folder_name> drop <entry>*    # delete the entries with the given IDs or names (a name deletes all entries with that name) in one go; the folder must be unlocked; IDs are shown by "list" and do not change when other entries are deleted',
+    'folder <folder_name> import <file> [<key>]    # add all entries of a .csv (with a name,login,password,note header) or .jsonl file to the folder; a locked folder needs its key',
+    'folder <folder_name> export [--format txt|csv|jsonl] [--out <file>] [--raw]    # write all entries of a folder into a file (<folder_name>.txt by default); a locked folder is only exported with --raw, as ciphertext',
+    'folder <folder_name> info [--since <YYYY-MM-DD>] [--limit <n>] [--page <p>]    # print log history of a folder, optionally only the records since a date, <n> lines at a time (page <p>, starting at 1); the folder must me unlocked',
+    'find <query> [--all]    # find entries whose name (or login, in unlocked folders) contains the query, in this storage or in every open one',
+    'logkeep [<n>|<days>d|off]    # show or set how much log history every folder keeps: the last <n> records or the records of the last <days> days; older records are rolled up into counts',
+    'export [--format txt|csv|jsonl] [--out <file>] [--raw]    # write the entries of all unlocked folders (and of the locked ones as ciphertext with --raw) into one file',
+    'compress [off|zlib|lzma [<level>]]    # show or set how the storage file is compressed (level 0..9, 6 by default); the next save rewrites the whole file',
+    'list [--all]    # list all folders in this storage (or in every open storage)',
+    'open <storage>*    # open more storage files (loaded in parallel) and use the first of them; all open storages stay in memory and are saved by "close"',
+    'use <storage>    # make another open storage the one that all commands work on',
+    'storages    # list the open storages',
+    'listv [--page <p>] [--limit <n>]    # list all folders with their contents; pages over the entries of all folders like "folder <folder_name> list"',
     'lock <key>    # try to apply lock command to all folders',
     'lock     # try to apply lock commands to all folders using the last key used with the "unlock <key>" command',
     'unlock <key>    # try to apply unlock command to all folders',
+    'lazy [on|off]    # show or set the lazy unlock mode: unlocking only checks the key and every field is decrypted when it is first shown; on by default',
+    'workers [<n>]    # show or set the number of processes used by "lock <key>" and "unlock <key>" on large storages; 1 disables the parallel mode',
+    'stats [reset]    # show (or clear) the latency of every command so far and how much the cifers encrypted and decrypted',
+    'profile [on [<n>] [--out <file>]|off]    # profile the next <n> commands (1 by default) with cProfile and print where the time went; --out also writes the statistics to a file for other profiling tools',
     'gen [<length>]    # generate a password string; default length is 15',
+    'gen <length> <count>    # generate <count> passwords at once, one per line',
+    'audit [--weak <score>] [--limit <n>]    # score the passwords of all unlocked folders like "check" and list the weak ones (scored below 0.6 by default) and the ones used by several entries',
     'allowed     # show all allowed charachters for the entries'
 ]
 HELP_LIST = [
     el.split('    # ') for el in HELP_STR
 ]
+# command names for the latency statistics (see instrument.command_name)
+COMMANDS = {pattern.split()[0] for pattern, _ in HELP_LIST} | {'sc', 'check'}
+FOLDER_COMMANDS = {pattern.split()[2] for pattern, _ in HELP_LIST if pattern.startswith('folder <folder_name> ')}
+
+
+def _entry_field(field: str) -> property:
+    return property(
+        lambda self: self.get_field(field),
+        lambda self, value: self.set_field(field, value)
+    )
 
 
-@dataclass
 class Entry:
-    name: str
-    login: str
-    password: str
-    note: str = ''
+    # login, password and note live in the _login/_password/_note slots; while the entry belongs to a lazily
+    # unlocked folder they still hold the ciphertext and a field is decrypted with _key the first time it is read
+    __slots__ = ('name', '_login', '_password', '_note', '_key', '_cache', '_dirty')
+    FIELDS = ('login', 'password', 'note')
+
+    def __init__(self, name: str, login: str, password: str, note: str = '') -> None:
+        # names and logins repeat a lot across a storage, so they are interned
+        self.name = sys.intern(name)
+        self._login = sys.intern(login)
+        self._password = password
+        self._note = note
+        self._key: str | None = None
+        self._cache: dict[str, str] | None = None # materialized plaintext of the lazily unlocked fields
+        self._dirty: set[str] | None = None # fields assigned since the lazy unlock
+
+    login = _entry_field('login')
+    password = _entry_field('password')
+    note = _entry_field('note')
+
+    def get_field(self, field: str) -> str:
+        if self._key is None:
+            return getattr(self, '_' + field)
+        if field not in self._cache:
+            self._cache[field] = cifer.decrypt(getattr(self, '_' + field), self._key)
+        return self._cache[field]
+
+    def set_field(self, field: str, value: str) -> None:
+        if self._key is None:
+            setattr(self, '_' + field, value)
+        else:
+            self._cache[field] = value
+            self._dirty.add(field)
+
+    def get_stored(self, field: str) -> str:
+        # the raw stored value (ciphertext while the field is pending)
+        return getattr(self, '_' + field)
+
+    def unlock_lazily(self, key: str) -> None:
+        self._key = key
+        self._cache = {}
+        self._dirty = set()
+
+    def is_pending(self, field: str) -> bool:
+        # whether reading the field would decrypt it
+        return self._key is not None and field not in self._cache
+
+    def fill(self, field: str, value: str) -> None:
+        # caches the plaintext of a pending field decrypted elsewhere (e.g. in a batch)
+        self._cache[field] = value
+
+    def stale_fields(self, key: str) -> tuple[str, ...]:
+        # fields that have to be (re-)encrypted when locking with key; the rest still has a valid stored ciphertext
+        if self._key is None or self._key != key:
+            return Entry.FIELDS
+        return tuple(f for f in Entry.FIELDS if f in self._dirty)
+
+    def seal(self, values: dict[str, str]) -> None:
+        # stores the given raw values and drops the lazy state
+        for field, value in values.items():
+            setattr(self, '_' + field, value)
+        self._key = None
+        self._cache = None
+        self._dirty = None
+
+    def snapshot(self) -> tuple[tuple[str, str, str, str], tuple[int, ...]]:
+        # (name, login, password, note) as far as they are known without decrypting anything, and the positions
+        # in it of the fields that are still ciphertext (see FrozenFolder)
+        if self._key is None:
+            return stored_values(self), ()
+        if not self._cache:
+            return stored_values(self), (1, 2, 3)
+        values = [self.name]
+        pending = []
+        for i, field in enumerate(Entry.FIELDS, 1):
+            if field in self._cache:
+                values.append(self._cache[field])
+            else:
+                values.append(getattr(self, '_' + field))
+                pending.append(i)
+        return tuple(values), tuple(pending)
+
+    def __getstate__(self) -> tuple:
+        # pickled as plain fields, so the lazy key never ends up on disk
+        return self.name, self.login, self.password, self.note
+
+    def __setstate__(self, state: tuple | dict) -> None:
+        if isinstance(state, dict): # storages written when Entry was a dataclass
+            state = state['name'], state['login'], state['password'], state['note']
+        self.__init__(*state)
+
+    def __repr__(self) -> str:
+        return f'Entry(name={self.name!r}, login={self.login!r}, password={self.password!r}, note={self.note!r})'
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Entry):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
     def __str__(self) -> str:
         note = ' | ' + self.note if self.note else ''
         return f'{self.name} | {self.login} | {self.password}{note}'
 
 
+# raw (name, login, password, note) of an entry, ciphertext while a field is pending
+stored_values = attrgetter('name', '_login', '_password', '_note')
+
+
+def crypt_fields(fields: list[str], key: str, decrypt: bool) -> list[str]:
+    # process pool worker: encrypts or decrypts a chunk of fields
+    return cifer.decrypt_batch(fields, key) if decrypt else cifer.encrypt_batch(fields, key)
+
+
 class LogEntry:
+    # a log record as it was stored before LogHistory; only needed to read old storages
     def __init__(self, action: str) -> None:
         self.date = datetime.now()
         self.action = action
@@ -60,21 +206,232 @@ class LogEntry:
         return f'[blue]{self.date}[/]: [cyan]{self.action}[/]'
 
 
+class LogHistory:
+    # columnar log of a folder: timestamps, codes into an interned table of actions and an optional argument
+    # (e.g. the entry name of "added entry <name>"); much smaller than a list of LogEntry objects
+    LEGACY_PREFIXES = ('added entry ', 'deleted entry ')
+
+    # older records can be rolled up into per-action counts, keeping only the last keep_last records
+    # and/or the records of the last keep_days days
+    def __init__(self) -> None:
+        self.times = array('d')
+        self.codes = array('H')
+        self.args: list[str | None] = []
+        self.actions: list[str] = []
+        self._action_codes: dict[str, int] = {}
+        self.rollups: dict[str, list] = {} # action -> [count, first timestamp, last timestamp]
+        self.keep_last: int | None = None
+        self.keep_days: float | None = None
+
+    def append(self, timestamp: float, action: str, arg: str | None = None) -> None:
+        code = self._action_codes.get(action)
+        if code is None:
+            code = self._action_codes[action] = len(self.actions)
+            self.actions.append(action)
+        self.times.append(timestamp)
+        self.codes.append(code)
+        self.args.append(arg)
+
+    def append_legacy(self, log_ent: LogEntry) -> None:
+        for prefix in LogHistory.LEGACY_PREFIXES:
+            if log_ent.action.startswith(prefix):
+                self.append(log_ent.date.timestamp(), prefix[:-1], log_ent.action[len(prefix):])
+                return
+        self.append(log_ent.date.timestamp(), log_ent.action)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def set_retention(self, keep_last: int | None, keep_days: float | None) -> None:
+        self.keep_last = keep_last
+        self.keep_days = keep_days
+
+    def _cutoff(self, now: float) -> int:
+        # number of oldest records the retention policy wants rolled up
+        cut = 0
+        if self.keep_last is not None:
+            cut = max(cut, len(self) - self.keep_last)
+        if self.keep_days is not None:
+            cut = max(cut, bisect_left(self.times, now - self.keep_days * 86400))
+        return cut
+
+    def needs_compaction(self, now: float) -> bool:
+        # leaves some slack, so that the O(n) compaction only runs every so often
+        if not len(self):
+            return False
+        if self.keep_last is not None and len(self) > self.keep_last + self.keep_last // 4 + 1:
+            return True
+        return self.keep_days is not None and self.times[0] < now - self.keep_days * 86400 * 1.1
+
+    def compact(self, now: float) -> bool:
+        # rolls the records outside of the retention policy up into counts; returns whether anything changed
+        cut = self._cutoff(now)
+        if cut <= 0:
+            return False
+        for i in range(cut):
+            action = self.actions[self.codes[i]]
+            rollup = self.rollups.setdefault(action, [0, self.times[i], self.times[i]])
+            rollup[0] += 1
+            rollup[1] = min(rollup[1], self.times[i])
+            rollup[2] = max(rollup[2], self.times[i])
+        del self.times[:cut]
+        del self.codes[:cut]
+        del self.args[:cut]
+        return True
+
+    def start_index(self, since: float | None) -> int:
+        return 0 if since is None else bisect_left(self.times, since)
+
+    def record(self, i: int) -> tuple[datetime, str]:
+        action = self.actions[self.codes[i]]
+        if self.args[i] is not None:
+            action = f'{action} {self.args[i]}'
+        return datetime.fromtimestamp(self.times[i]), action
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def copy(self) -> 'LogHistory':
+        log_history = LogHistory.__new__(LogHistory)
+        log_history.__setstate__((
+            self.times[:], self.codes[:], list(self.args), list(self.actions),
+            {action: list(rollup) for action, rollup in self.rollups.items()}, self.keep_last, self.keep_days
+        ))
+        return log_history
+
+    def __getstate__(self) -> tuple:
+        return self.times, self.codes, self.args, self.actions, self.rollups, self.keep_last, self.keep_days
+
+    def __setstate__(self, state: tuple) -> None:
+        self.times, self.codes, self.args, self.actions, self.rollups, self.keep_last, self.keep_days = state
+        self._action_codes = {action: code for code, action in enumerate(self.actions)}
+
+
+class EntryTable:
+    # entries of a folder in display order, keyed by a stable ID (which does not change when other entries
+    # are deleted) and indexed by name, so that lookups and deletions by ID or name are O(1)
+    def __init__(self, entries=()) -> None:
+        self._by_id: dict[int, Entry] = {}
+        self._by_name: dict[str, dict[int, None]] = {} # name -> IDs of the entries with this name, in order
+        self.next_id = 0
+        self.extend(entries)
+
+    def append(self, entry: Entry) -> int:
+        entry_id = self.next_id
+        self.next_id += 1
+        self._by_id[entry_id] = entry
+        self._by_name.setdefault(entry.name, {})[entry_id] = None
+        return entry_id
+
+    def extend(self, entries) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def items(self, start: int = 0, stop: int | None = None):
+        # (ID, entry) pairs of the positions [start:stop]
+        return islice(self._by_id.items(), start, stop)
+
+    def get(self, entry_id: int) -> Entry | None:
+        return self._by_id.get(entry_id)
+
+    def ids_by_name(self, name: str) -> list[int]:
+        return list(self._by_name.get(name, ()))
+
+    def pop(self, entry_id: int) -> Entry:
+        entry = self._by_id.pop(entry_id)
+        ids = self._by_name[entry.name]
+        del ids[entry_id]
+        if not ids:
+            del self._by_name[entry.name]
+        return entry
+
+    def __getstate__(self) -> tuple:
+        return self.next_id, list(self._by_id.items())
+
+    def __setstate__(self, state: tuple) -> None:
+        next_id, items = state
+        self.__init__()
+        for entry_id, entry in items:
+            self._by_id[entry_id] = entry
+            self._by_name.setdefault(entry.name, {})[entry_id] = None
+        self.next_id = next_id
+
+
 class Folder:
-    # core database class - holds a list of Entries and performs logical operations on them
+    # core database class - holds the Entries (see EntryTable) and performs logical operations on them
+    lazy_key: str | None = None # set while the folder is unlocked lazily (see decrypt)
+    _rewrite = False # the unsaved changes touch every entry, so the whole folder has to be saved
+    locked_since_save = False # earlier saves may hold the plaintext, so the next one has to rewrite the whole storage
+    search_index = None # TrigramIndex the folder is registered in (see storage.FolderIndex)
+    TRANSIENT = ('lazy_key', '_rewrite', 'locked_since_save', '_changes', 'search_index') # never pickled
+
     def __init__(self, name) -> None:
         self.name = name
-        self.entries: list[Entry] = []
+        self.entries = EntryTable()
         self.key_hash: int | None = None # storing hash of a key
         self.unlocked = True
-        self.log_history: list[LogEntry] = []
+        self.log_history = LogHistory()
         self.log('created')
+
+    def __setstate__(self, state: dict) -> None:
+        if isinstance(state['log_history'], list): # storages written before LogHistory
+            log_history = LogHistory()
+            for log_ent in state['log_history']:
+                log_history.append_legacy(log_ent)
+            state['log_history'] = log_history
+        if isinstance(state['entries'], list): # storages written before EntryTable; the IDs start as positions
+            state['entries'] = EntryTable(state['entries'])
+        self.__dict__.update(state)
     
-    def log(self, action: str) -> None:
-        self.log_history.append(LogEntry(action))
+    def log(self, action: str, arg: str | None = None) -> None:
+        record = (datetime.now().timestamp(), action, arg)
+        self.log_history.append(*record)
+        self._record('log', record)
+        if self.log_history.needs_compaction(record[0]):
+            self.compact_log()
+
+    def set_log_retention(self, keep_last: int | None, keep_days: float | None) -> None:
+        self.log_history.set_retention(keep_last, keep_days)
+        self._record('retention', (keep_last, keep_days))
+        self.compact_log()
+
+    def compact_log(self) -> None:
+        # a compaction rewrites the history, so the journal cannot express it as appended records
+        if self.log_history.compact(datetime.now().timestamp()):
+            self._rewrite = True
+
+    def _record(self, op: str, payload) -> None:
+        # remembers a change for the incremental save (see storage.JournalStorage)
+        self.__dict__.setdefault('_changes', []).append((op, payload))
+
+    def pop_changes(self) -> list[tuple] | None:
+        # returns and forgets the (op, payload) changes since the last call; None if the whole folder changed
+        changes = self.__dict__.pop('_changes', [])
+        self.locked_since_save = False
+        if self._rewrite:
+            self._rewrite = False
+            return None
+        return changes
     
+    def iter_info(self, since: datetime | None = None):
+        # rich lines of the log: the rolled up counts first, then the kept records (only the ones after since)
+        since_ts = since.timestamp() if since is not None else None
+        for action, (count, first, last) in self.log_history.rollups.items():
+            if since_ts is None or last >= since_ts:
+                yield f'[magenta]{count}[/] x [cyan]{action}[/] between [blue]{datetime.fromtimestamp(first)}[/] and [blue]{datetime.fromtimestamp(last)}[/]'
+        for i in range(self.log_history.start_index(since_ts), len(self.log_history)):
+            date, action = self.log_history.record(i)
+            yield f'[blue]{date}[/]: [cyan]{action}[/]'
+
     def get_info(self) -> list[str]:
-        return [log_ent.to_rich() for log_ent in self.log_history]
+        return list(self.iter_info())
     
     def get_name(self) -> str:
         return self.name
@@ -82,24 +439,123 @@ class Folder:
     def get_unlocked(self) -> bool:
         return self.unlocked
 
-    def encrypt(self, key) -> None:
+    def get_fields(self) -> list[str]:
+        # passwords, notes and logins of all entries, flattened in this order
+        return [f for e in self.entries for f in (e.password, e.note, e.login)]
+
+    def iter_rows(self, chunk_size: int, start: int = 0, stop: int | None = None, with_ids: bool = False):
+        # (name, login, password, note) of the entries [start:stop] in chunks of chunk_size, prefixed with
+        # the entry ID if with_ids; the fields still encrypted after a lazy unlock are decrypted in one batch
+        # per chunk and not cached, so that streaming a large folder does not keep its plaintext around
+        items = self.entries.items(start, stop)
+        while batch := list(islice(items, chunk_size)):
+            plain = self._decrypt_pending(e for _, e in batch)
+            yield [
+                (*((str(entry_id),) if with_ids else ()), e.name,
+                 *(plain[id(e), f] if (id(e), f) in plain else e.get_field(f) for f in Entry.FIELDS))
+                for entry_id, e in batch
+            ]
+
+    def _decrypt_pending(self, entries) -> dict[tuple[int, str], str]:
+        # plaintext of the fields still encrypted after a lazy unlock by (id(entry), field), decrypted in one
+        # batch that bypasses the caches
+        pending = [(e, f) for e in entries for f in Entry.FIELDS if e.is_pending(f)]
+        if not pending:
+            return {}
+        values = cifer.decrypt_batch([e.get_stored(f) for e, f in pending], self.lazy_key, cache=False)
+        return {(id(e), f): value for (e, f), value in zip(pending, values)}
+
+    def plain_entries(self) -> EntryTable:
+        # copy of the entries with every field in plaintext, for pickling a lazily unlocked folder
+        # (the entries themselves stay lazy and nothing is cached)
+        plain = self._decrypt_pending(self.entries)
+        items = [
+            (entry_id, Entry(e.name, *(plain[id(e), f] if (id(e), f) in plain else e.get_field(f) for f in Entry.FIELDS)))
+            for entry_id, e in self.entries.items()
+        ]
+        table = EntryTable.__new__(EntryTable)
+        table.__setstate__((self.entries.next_id, items))
+        return table
+
+    def iter_field(self, field: str, chunk_size: int):
+        # (entry names, values) of one field of all entries in chunks of chunk_size, decrypted like in iter_rows
+        it = iter(self.entries)
+        while chunk := list(islice(it, chunk_size)):
+            pending = [i for i, e in enumerate(chunk) if e.is_pending(field)]
+            values = [e.get_stored(field) if e.is_pending(field) else e.get_field(field) for e in chunk]
+            if pending:
+                for i, value in zip(pending, cifer.decrypt_batch([values[i] for i in pending], self.lazy_key, cache=False)):
+                    values[i] = value
+            yield [e.name for e in chunk], values
+
+    def get_logins(self) -> list[str]:
+        # logins of all entries; the ones still encrypted after a lazy unlock are decrypted in one batch
+        pending = [e for e in self.entries if e.is_pending('login')]
+        if pending:
+            logins = cifer.decrypt_batch([e.get_stored('login') for e in pending], self.lazy_key)
+            for e, login in zip(pending, logins):
+                e.fill('login', login)
+        return [e.login for e in self.entries]
+
+    def set_fields(self, fields: list[str]) -> None:
+        for e, password, note, login in zip(self.entries, fields[0::3], fields[1::3], fields[2::3]):
+            e.seal({'password': password, 'note': note, 'login': login})
+
+    def encrypt(self, key, crypted: list[str] | None = None) -> None:
+        # crypted: fields already encrypted elsewhere (e.g. by a process pool)
         self.key_hash = utils.hashf(key)
         self.unlocked = False
-        for e in self.entries:
-            e.password = cifer.encrypt(e.password, key)
-            e.note = cifer.encrypt(e.note, key)
-            e.login = cifer.encrypt(e.login, key)
+        self._rewrite = True
+        self.locked_since_save = True
+        if crypted is not None:
+            self.set_fields(crypted)
+        else:
+            # after a lazy unlock with the same key only the changed fields need a new ciphertext; with another
+            # key the fields not read yet are decrypted in one batch first instead of one by one
+            stale = [(e, f) for e in self.entries for f in e.stale_fields(key)]
+            plain = self._decrypt_pending(self.entries) if self.lazy_key not in (None, key) else {}
+            res = cifer.encrypt_batch(
+                [plain[id(e), f] if (id(e), f) in plain else e.get_field(f) for e, f in stale], key
+            )
+            sealed: dict[int, dict[str, str]] = {}
+            for (e, f), value in zip(stale, res):
+                sealed.setdefault(id(e), {})[f] = value
+            for e in self.entries:
+                e.seal(sealed.get(id(e), {}))
+        self.lazy_key = None
+        if self.search_index is not None:
+            self.search_index.folder_locked(self)
         self.log('encrypted')
 
-    def decrypt(self, key: str) -> None:
+    def decrypt(self, key: str, crypted: list[str] | None = None, lazy: bool = False) -> None:
+        # lazy: only mark the folder unlocked; every field is decrypted when it is first read
         self.key_hash = None
         self.unlocked = True
-        for e in self.entries:
-            e.password = cifer.decrypt(e.password, key)
-            e.note = cifer.decrypt(e.note, key)
-            e.login = cifer.decrypt(e.login, key)
+        self._rewrite = True
+        if lazy:
+            self.lazy_key = key
+            for e in self.entries:
+                e.unlock_lazily(key)
+        else:
+            if crypted is None:
+                crypted = cifer.decrypt_batch(self.get_fields(), key)
+            self.set_fields(crypted)
+        if self.search_index is not None:
+            self.search_index.folder_unlocked(self)
         self.log('decrypted')
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for attr in Folder.TRANSIENT:
+            state.pop(attr, None)
+        if self.lazy_key is not None:
+            # reading the lazy fields one by one would decrypt and cache every one of them
+            state['entries'] = self.plain_entries()
+        return state
     
+    def freeze(self) -> 'FrozenFolder':
+        return FrozenFolder(self)
+
     def is_decryptable(self, key: str) -> bool:
         return utils.hashf(key) == self.key_hash
     
@@ -107,17 +563,53 @@ class Folder:
         if not self.get_unlocked():
             return '[red]Cannot add entry to locked folder'
         self.entries.append(entry)
-        self.log(f'added entry {entry.name}')
+        if self.search_index is not None:
+            self.search_index.add_entry(self, entry)
+        self._record('add', Entry(*entry.__getstate__()))
+        self.log('added entry', entry.name)
         return f'[green]Added entry [white]{entry.name}[/] to folder [cyan]{self.name}'
     
-    def delete_entry(self, entry_index: int) -> str:
-        if 0 <= entry_index < len(self.entries):
-            ent_name = self.entries[entry_index].name
-            del self.entries[entry_index]
-            self.log(f'deleted entry {ent_name}')
-            return f'[green]Deleted entry [white]{ent_name}[/] from folder [cyan]{self.name}'
-        else:
-            return f'[red]Invalid index: {entry_index}; must be in 0..{len(self.entries)-1}'
+    def add_entries(self, entries: list[Entry], key: str | None = None) -> None:
+        # appends a batch of entries with a single log record; the entries of a locked folder are
+        # encrypted in one batch with key, which the caller has checked with is_decryptable
+        if not self.get_unlocked():
+            fields = cifer.encrypt_batch([f for e in entries for f in (e.password, e.note, e.login)], key)
+            for e, password, note, login in zip(entries, fields[0::3], fields[1::3], fields[2::3]):
+                e.seal({'password': password, 'note': note, 'login': login})
+        self.entries.extend(entries)
+        for e in entries:
+            if self.search_index is not None:
+                self.search_index.add_entry(self, e)
+            self._record('add', Entry(*e.__getstate__()))
+        self.log('imported entries', str(len(entries)))
+
+    def find_ids(self, refs: list[str]) -> tuple[list[int], list[str]]:
+        # resolves entry references into entry IDs: a number is the ID of an entry if there is one,
+        # anything else a name, which stands for all entries with that name; also returns the references
+        # that match nothing
+        ids, missing = {}, []
+        for ref in refs:
+            if ref.isdigit() and self.entries.get(int(ref)) is not None:
+                found = [int(ref)]
+            else:
+                found = self.entries.ids_by_name(ref)
+            if not found:
+                missing.append(ref)
+            ids.update(dict.fromkeys(found))
+        return list(ids), missing
+
+    def delete_entries(self, entry_ids: list[int]) -> list[str]:
+        # deletes the entries in one pass with a single journal record; returns their names
+        names = []
+        for entry_id in entry_ids:
+            entry = self.entries.pop(entry_id)
+            if self.search_index is not None:
+                self.search_index.remove_entry(entry)
+            names.append(entry.name)
+        self._record('delete_ids', list(entry_ids))
+        for name in names:
+            self.log('deleted entry', name)
+        return names
 
     def __str__(self) -> str:
         unlocked_indicator = 'LOCKED ' if not self.get_unlocked() else ''
@@ -128,13 +620,99 @@ class Folder:
         return f'{unlocked_indicator} folder [cyan]{self.name}[/] with {len(self.entries)} entr{"y" if len(self.entries) == 1 else "ies"}'
 
 
+class FrozenFolder:
+    # copy of a folder that a save takes on the calling thread: the entries as tuples (see Entry.snapshot) and
+    # a copy of the log. thaw turns it into a folder that pickles exactly like the original did at that moment;
+    # it runs on the writer thread (see storage.BackgroundSaver) along with decrypting the fields that were
+    # still pending after a lazy unlock
+    def __init__(self, folder: Folder) -> None:
+        state = folder.__dict__.copy()
+        for attr in Folder.TRANSIENT:
+            state.pop(attr, None)
+        state['entries'] = None # set by thaw; the attributes keep their order, so the pickle does too
+        state['log_history'] = folder.log_history.copy()
+        self.state = state
+        self.next_id = folder.entries.next_id
+        items = list(folder.entries.items())
+        self.ids = list(map(itemgetter(0), items))
+        if folder.lazy_key is None:
+            self.rows = list(map(stored_values, map(itemgetter(1), items)))
+            self.pending: dict[int, tuple[int, ...]] = {} # row -> positions of the fields that are still ciphertext
+            self.stream = None
+        else:
+            snapshots = [e.snapshot() for _, e in items]
+            self.rows = [values for values, _ in snapshots]
+            self.pending = {i: cols for i, (_, cols) in enumerate(snapshots) if cols}
+            # the keystream instead of the key, taken from the cache here, so that the writer never touches the caches
+            self.stream = cifer.cached_keystream(folder.lazy_key)
+
+    def thaw(self) -> Folder:
+        rows = self.rows
+        pending = [(i, col) for i, cols in self.pending.items() for col in cols]
+        if pending:
+            rows = list(rows)
+            plain = crypt_tools.apply_keystream_batch([rows[i][col] for i, col in pending], self.stream, -1)
+            for (i, col), value in zip(pending, plain):
+                rows[i] = (*rows[i][:col], value, *rows[i][col+1:])
+        entries = EntryTable.__new__(EntryTable)
+        entries.__setstate__((self.next_id, list(zip(self.ids, starmap(Entry, rows)))))
+        folder = Folder.__new__(Folder)
+        folder.__dict__.update(self.state, entries=entries)
+        return folder
+
+
+@dataclass
+class OpenStorage:
+    # a storage kept open by the app; the current one is also mirrored in the App attributes (see App.use_storage)
+    path: str
+    storage: JournalStorage
+    databases: FolderIndex
+    saver: BackgroundSaver
+    save_requested: bool = False
+    default_key: str | None = None
+
+
+def get_storage_name(path: str) -> str:
+    name = os.path.basename(path)
+    return name[:-5] if name.endswith('.pass') else name
+
+
+def load_storage(path: str) -> tuple[JournalStorage, FolderIndex]:
+    storage = JournalStorage(path)
+    return storage, storage.load()
+
+
 class App:
-    def __init__(self) -> None:
+    def __init__(self, storage: str | None = None, interactive: bool = True, assume_yes: bool = False) -> None:
+        # storage: open this storage file (creating it if it does not exist) instead of asking;
+        # interactive=False: commands come from run_batch, confirmations are answered with assume_yes
+        # and "save" is deferred to a single save when the app is closed
         self.running = True
+        self.interactive = interactive
+        self.assume_yes = assume_yes
+        self.save_requested = False
         self.app_files = glob.glob('./*.pass')
         self.default_key = None
-        self.cns = Console()
-        
+        # the numpy batch path is faster than shipping fields to other processes, so only pure python uses the pool by default
+        self.workers = 1 if crypt_tools.has_numpy() else (os.cpu_count() or 1)
+        self.lazy_unlock = True
+        self.saver: BackgroundSaver | None = None
+        self.storages: dict[str, OpenStorage] = {} # open storages by name
+        self.current: str | None = None # name of the storage the commands work on
+        self.autosave_interval: float | None = None
+        self.autosave_timer: storage.AutosaveTimer | None = None # started by the first "autosave <seconds>"
+        self.lock = threading.RLock() # held while a command runs, so that autosave never saves half of one
+        self.command_stats = instrument.CommandStats()
+        self.profiler = instrument.Profiler()
+        self.cns = ru.get_console()
+
+        if storage is not None:
+            self.DBFILE = storage
+            if os.path.exists(storage):
+                self.loading_existing_storage(storage)
+            else:
+                self.creating_new_storage(storage[:-5] if storage.endswith('.pass') else storage)
+            return
         self.cns.print('[magenta underline]CL Password Manager[/] [green]v0.4[/] (from [cyan]10.03.23[/])')
         print()
         if not self.app_files:
@@ -162,68 +740,409 @@ class App:
             self.creating_new_storage()
 
     def loading_existing_storage(self, storage_name: str):
-        with open(storage_name, 'rb') as f:
+        try:
+            journal, databases = load_storage(storage_name)
+        except Exception as e:
+            self.cns.print(f'[red]Error occured when reading the storage file: [red]{e}[/]')
+            self.close()
+        else:
+            self.add_storage(storage_name, journal, databases)
+            self.use_storage(get_storage_name(storage_name))
+            self.cns.print(ru.get_rich_panel(f'STORAGE [magenta]{storage_name[:-5]}'))
+
+    def add_storage(self, path: str, journal: JournalStorage, databases: FolderIndex) -> OpenStorage:
+        opened = OpenStorage(path, journal, databases, BackgroundSaver(journal))
+        self.storages[get_storage_name(path)] = opened
+        return opened
+
+    def use_storage(self, name: str) -> None:
+        # makes an open storage the current one; the state kept per storage is stored back first
+        if self.current in self.storages:
+            current = self.storages[self.current]
+            current.save_requested = self.save_requested
+            current.default_key = self.default_key
+        opened = self.storages[name]
+        self.current = name
+        self.DBFILE = opened.path
+        self.storage = opened.storage
+        self.databases = opened.databases
+        self.saver = opened.saver
+        self.save_requested = opened.save_requested
+        self.default_key = opened.default_key
+
+    def open_storages(self, paths: list[str]) -> None:
+        # loads the storages on a thread pool (reading and mapping the files overlaps) and makes the first one current
+        paths = [p if p.endswith('.pass') else p + '.pass' for p in paths]
+        for p in paths:
+            if not os.path.exists(p):
+                self.cns.print(f'[red]No storage file [white]{p}')
+        new = [p for p in dict.fromkeys(paths) if os.path.exists(p) and get_storage_name(p) not in self.storages]
+        with ThreadPoolExecutor(min(len(new), LOAD_THREADS) or 1) as ex:
+            futures = [ex.submit(load_storage, p) for p in new]
+        for p, future in zip(new, futures):
             try:
-                self.databases: dict[str, Folder] = pickle.load(f)
+                journal, databases = future.result()
             except Exception as e:
-                self.cns.print(f'[red]Error occured when reading the storage file: [red]{e}[/]')
-                self.close()
-            else:
-                self.cns.print(ru.get_rich_panel(f'STORAGE [magenta]{storage_name[:-5]}'))
+                self.cns.print(f'[red]Error occured when reading [white]{p}[/]: [red]{e}[/]')
+                continue
+            self.add_storage(p, journal, databases)
+            self.cns.print(f'[green]Opened storage [magenta]{get_storage_name(p)}[/] with {len(databases)} folder(s)')
+        first = get_storage_name(paths[0])
+        if first in self.storages and first != self.current:
+            self.use_storage(first)
+            self.cns.print(f'[green]Using storage [magenta]{first}')
+
+    def show_storages(self) -> None:
+        rows = [
+            ['[green]*[/]' if name == self.current else '', f'[magenta]{name}[/]', opened.path, str(len(opened.databases))]
+            for name, opened in self.storages.items()
+        ]
+        self.cns.print(ru.get_rich_table(['', 'Storage', 'File', '# of folders'], rows, 'Open storages'))
     
-    def creating_new_storage(self) -> None:
-        name = ru.input(self.cns, 'Input a name for a new storage: ')
+    def creating_new_storage(self, name: str | None = None) -> None:
+        if name is None:
+            name = ru.input(self.cns, 'Input a name for a new storage: ')
         self.DBFILE = f'{name}.pass'
         if '.\\' + self.DBFILE in self.app_files:
             self.cns.print('[yellow]A storage with this name already exists')
             if not ru.input(self.cns, '[yellow]Are you sure that you want to rewrite it? ([green]y[/]/[red]n[/]) ') == 'y':
                 self.close()
                 return
-        self.databases = dict()
+        self.add_storage(self.DBFILE, JournalStorage(self.DBFILE), FolderIndex())
+        self.use_storage(get_storage_name(self.DBFILE))
+        # a storage created by a batch run is written even if no command saved it
+        self.save_requested = not self.interactive
         self.cns.print(f'[green]Created new storage [magenta]{name}')
         self.cns.print(ru.get_rich_panel(f'STORAGE [magenta]{name}'))
 
-    def encrypt_db(self, db_name, key) -> None:
-        thisdb = self.databases[db_name]
-        if not thisdb.get_unlocked():
+    def crypt_parallel(self, key: str, decrypt: bool) -> dict[str, list[str]]:
+        # encrypts (or decrypts) the fields of all eligible folders in a process pool;
+        # returns the resulting fields by folder name or an empty dict if the storage is too small for that
+        if self.workers <= 1 or (decrypt and self.lazy_unlock):
+            return {}
+        # the index knows the lock state and size of every folder, so a small storage is turned down without
+        # decoding anything; every entry has three fields
+        candidates = {n: entries for n, unlocked, entries in self.databases.summaries() if unlocked != decrypt and entries}
+        if 3 * sum(candidates.values()) < PARALLEL_MIN_FIELDS:
+            return {}
+        if decrypt:
+            names = [n for n in candidates if self.databases[n].is_decryptable(key)]
+        else:
+            names = [n for n in candidates if self.databases[n].lazy_key is None]
+        # the fields are only gathered once the pool is known to pay off
+        if sum(3 * len(self.databases[n].entries) for n in names) < PARALLEL_MIN_FIELDS:
+            return {}
+        fields = [self.databases[n].get_fields() for n in names]
+        flat = [f for folder_fields in fields for f in folder_fields]
+        chunk = -(-len(flat) // self.workers)
+        chunks = [flat[i:i+chunk] for i in range(0, len(flat), chunk)]
+        with ProcessPoolExecutor(self.workers) as ex:
+            # map keeps the order of chunks, so the concatenation lines up with flat
+            res = [f for part in ex.map(crypt_fields, chunks, [key]*len(chunks), [decrypt]*len(chunks)) for f in part]
+        # the workers count in their own processes
+        crypt_tools.counters.add('decrypt' if decrypt else 'encrypt', len(flat), sum(map(len, flat)), cifer.passes(key))
+        crypted, start = {}, 0
+        for n, folder_fields in zip(names, fields):
+            crypted[n] = res[start:start+len(folder_fields)]
+            start += len(folder_fields)
+        return crypted
+
+    def encrypt_db(self, db_name, key, crypted: list[str] | None = None) -> None:
+        if not self.databases.unlocked(db_name):
             self.cns.print(f'[red]Folder [cyan]{db_name}[/] is already locked')
             return
 
-        thisdb.encrypt(key)
+        self.databases[db_name].encrypt(key, crypted)
         self.cns.print(f'[green]Folder [cyan]{db_name}[/] encrypted successfully')
     
-    def decrypt_db(self, db_name, key) -> None:
-        thisdb = self.databases[db_name]
-        if thisdb.get_unlocked():
+    def decrypt_db(self, db_name, key, crypted: list[str] | None = None) -> None:
+        if self.databases.unlocked(db_name):
             self.cns.print(f'[red]Folder [cyan]{db_name}[/] is already unlocked')
             return
+        thisdb = self.databases[db_name]
         if not thisdb.is_decryptable(key):
             self.cns.print(f'[red]Invalid key for folder [cyan]{db_name}')
             thisdb.log(f'decrypting unsuccessfull')
             return
 
-        thisdb.decrypt(key)
+        thisdb.decrypt(key, crypted, lazy=self.lazy_unlock and crypted is None)
         self.cns.print(f'[green]Folder [cyan]{db_name}[/] decrypted successfully')
         
     def save(self) -> None:
         if not self.databases:
             self.cns.print('[red]Empty list of folders')
             return
-        with open(self.DBFILE, 'wb') as f:
-            pickle.dump(self.databases, f)
-        self.cns.print('[green]Saved all folders')
+        if not self.interactive:
+            self.save_requested = True
+            self.cns.print('[green]All folders will be saved at the end')
+            return
+        self.report_save_error()
+        self.saver.request(self.databases)
+        self.cns.print('[green]Saving all folders')
+
+    def report_save_error(self, opened: OpenStorage | None = None) -> None:
+        saver, journal = (self.saver, self.storage) if opened is None else (opened.saver, opened.storage)
+        error = saver.pop_error()
+        if error is not None:
+            self.cns.print(f'[red]Error occured when writing the storage file {journal.path}: [red]{error}[/]')
+            journal.known = None # the next save rewrites the whole storage
+
+    def set_autosave(self, interval: float | None) -> None:
+        self.autosave_interval = interval
+        if self.autosave_timer is None:
+            if interval is None:
+                return
+            self.autosave_timer = storage.AutosaveTimer(self.autosave)
+        self.autosave_timer.set_interval(interval)
+
+    def autosave(self) -> None:
+        # called by the autosave timer on its own thread; saves every open storage (one without changes costs
+        # nothing). A batch run still saves only once at the end
+        with self.lock:
+            if not self.running or not self.interactive:
+                return
+            for opened in self.storages.values():
+                if opened.databases:
+                    self.report_save_error(opened)
+                    opened.saver.request(opened.databases)
+
+    def confirm(self, prompt_text: str) -> bool:
+        if not self.interactive:
+            return self.assume_yes
+        return ru.input(self.cns, prompt_text) == 'y'
 
     def close(self) -> None:
         self.running = False
+        if self.autosave_timer is not None:
+            self.autosave_timer.close()
+        if self.current is not None:
+            self.use_storage(self.current) # stores the state of the current storage back
+        for opened in self.storages.values():
+            if opened.save_requested:
+                opened.saver.request(opened.databases)
+                opened.save_requested = False
+        for opened in self.storages.values():
+            opened.saver.wait()
+            self.report_save_error(opened)
+            opened.saver.close()
+            opened.databases.close()
+        self.save_requested = False
+        crypt_tools.wipe_caches()
         self.cns.print('[green]Closed successfully')
 
-    def display_db_as_table(self, db: Folder):
-        rich_folder_table = ru.get_rich_db_table(
-            [[ent.name, ent.login, ent.password, ent.note] for ent in db.entries], 
-            db.to_rich()
+    def import_entries(self, db_name: str, filename: str, key: str | None) -> None:
+        thisdb = self.databases[db_name]
+        if not thisdb.get_unlocked():
+            if key is None:
+                self.cns.print('[red]Importing into a locked folder needs its key')
+                return
+            if not thisdb.is_decryptable(key):
+                self.cns.print(f'[red]Invalid key for folder [cyan]{db_name}')
+                return
+        imported, skipped = 0, []
+        try:
+            for rows, errors in transfer.iter_import_batches(filename):
+                if rows:
+                    thisdb.add_entries([Entry(*row) for row in rows], key)
+                imported += len(rows)
+                skipped.extend(errors)
+        except (OSError, ValueError, csv.Error) as e:
+            self.cns.print(f'[red]Error occured when reading [white]{filename}[/]: {e}')
+            if imported:
+                # the batches before the error are already in the folder
+                self.cns.print(f'[yellow]The first [white]{imported}[/] entries were imported into folder [cyan]{db_name}[/] before the error')
+            return
+        for line_num, error in skipped[:10]:
+            self.cns.print(f'[yellow]Skipped line {line_num}: {error}')
+        if len(skipped) > 10:
+            self.cns.print(f'[yellow]... and {len(skipped) - 10} more')
+        self.cns.print(f'[green]Imported [white]{imported}[/] entries into folder [cyan]{db_name}[/]; skipped {len(skipped)}')
+
+    def export(self, db_names: list[str], options: list[str], default_name: str) -> None:
+        try:
+            opts = utils.parse_options(options, {'format', 'out'}, flags={'raw'})
+        except ValueError as e:
+            self.cns.print(f'[red]{e}')
+            return
+        fmt = opts.get('format', 'txt')
+        if fmt not in transfer.EXPORT_FORMATS:
+            self.cns.print(f'[red]Unknown format {fmt}; use one of {", ".join(transfer.EXPORT_FORMATS)}')
+            return
+        filename = opts.get('out', f'{default_name}.{fmt}')
+        exported = []
+        for db_name in db_names:
+            if self.databases[db_name].get_unlocked() or opts.get('raw'):
+                exported.append(db_name)
+            else:
+                self.cns.print(f'[yellow]Skipped locked folder [cyan]{db_name}[/]; use --raw to export its ciphertext')
+        if not exported:
+            return
+        folders = (
+            (db_name, not self.databases[db_name].get_unlocked(), self.databases[db_name].iter_rows(transfer.EXPORT_CHUNK_SIZE))
+            for db_name in exported
         )
+        try:
+            with self.cns.status('Exporting...') as status:
+                count = transfer.export_folders(
+                    filename, fmt, folders,
+                    progress=lambda n: status.update(f'Exporting... {n} entries'),
+                    headings=len(db_names) > 1
+                )
+        except OSError as e:
+            self.cns.print(f'[red]Error occured when writing [white]{filename}[/]: {e}')
+            return
+        self.cns.print(f'[green]Exported [white]{count}[/] entries to [white]{filename}')
+
+    def audit(self, options: list[str]) -> None:
+        # scores the passwords of all unlocked folders and finds the reused ones by their hashes
+        try:
+            opts = utils.parse_options(options, {'weak', 'limit'})
+            weak_below = float(opts.get('weak', AUDIT_WEAK_SCORE))
+            limit = int(opts.get('limit', AUDIT_LIMIT))
+        except ValueError as e:
+            self.cns.print(f'[red]{e}')
+            return
+        weak, by_hash = [], {}
+        audited, folders, locked = 0, 0, 0
+        for db_name, unlocked, _ in list(self.databases.summaries()):
+            if not unlocked:
+                locked += 1
+                continue
+            folders += 1
+            for names, passwords in self.databases[db_name].iter_field('password', LIST_PAGE_SIZE * 10):
+                for name, password, score in zip(names, passwords, utils.score_passwords(passwords)):
+                    if score < weak_below:
+                        weak.append((score, db_name, name))
+                    by_hash.setdefault(utils.hashf(password), []).append((db_name, name))
+                audited += len(names)
+        self.cns.print(
+            f'Audited [blue]{audited}[/] passwords in [blue]{folders}[/] unlocked folder(s)'
+            + (f'; skipped [yellow]{locked}[/] locked folder(s)' if locked else '')
+        )
+        weak.sort()
+        if weak:
+            rows = [[f'[cyan]{db_name}[/]', name, f'{score:.0%}'] for score, db_name, name in weak[:limit]]
+            self.cns.print(ru.get_rich_table(['Folder', 'Name', 'Score'], rows, f'Weak passwords: {len(weak)}'))
+        reused = sorted((entries for entries in by_hash.values() if len(entries) > 1), key=len, reverse=True)
+        if reused:
+            rows = [
+                [str(len(entries)), ', '.join(f'{db_name}/{name}' for db_name, name in entries[:5]) + (', ...' if len(entries) > 5 else '')]
+                for entries in reused[:limit]
+            ]
+            self.cns.print(ru.get_rich_table(['Uses', 'Entries'], rows, f'Reused passwords: {len(reused)}'))
+        if len(weak) > limit or len(reused) > limit:
+            self.cns.print(f'[yellow]Showing at most {limit} rows per table; use --limit to see more')
+        if not weak and not reused and audited:
+            self.cns.print('[green]No weak or reused passwords')
+
+    def display_db_as_table(self, db: Folder, start: int = 0, stop: int | None = None):
+        # shows the entries [start:stop]; only these rows are decrypted and laid out
+        if ru.PLAIN:
+            ru.print_db_rows(db.to_rich(), db.iter_rows(LIST_PAGE_SIZE, start, stop, with_ids=True))
+            return
+        rows = [row for chunk in db.iter_rows(LIST_PAGE_SIZE, start, stop, with_ids=True) for row in chunk]
+        rich_folder_table = ru.get_rich_db_table(rows, db.to_rich())
         self.cns.print(rich_folder_table)
+
+    def parse_page(self, options: list[str]) -> tuple[int, int | None] | None:
+        # --page/--limit of the listing commands as (page, limit); the interactive output is paged by default,
+        # the plain one lists everything unless --limit is given. None if the options are invalid
+        try:
+            opts = utils.parse_options(options, {'page', 'limit'})
+            page = int(opts.get('page', 1))
+            limit = int(opts['limit']) if 'limit' in opts else (None if ru.PLAIN else LIST_PAGE_SIZE)
+        except ValueError as e:
+            self.cns.print(f'[red]{e}')
+            return None
+        if page <= 0 or (limit is not None and limit <= 0):
+            self.cns.print('[red]Limit and page must be positive')
+            return None
+        if limit is None and page != 1:
+            self.cns.print('[red]--page needs a --limit')
+            return None
+        return page, limit
+
+    def print_page_footer(self, start: int, stop: int, total: int, page: int, what: str) -> None:
+        if start == 0 and stop >= total:
+            return
+        if start >= total:
+            self.cns.print(f'[yellow]Page {page} is empty; there are only {total} {what}')
+            return
+        more = f'; next page: [blue]--page {page + 1}[/]' if stop < total else ''
+        self.cns.print(f'Showing [blue]{start + 1}-{stop}[/] of [blue]{total}[/] {what}{more}')
+
+    def list_folder(self, db_name: str, options: list[str]) -> None:
+        paging = self.parse_page(options)
+        if paging is None:
+            return
+        page, limit = paging
+        db = self.databases[db_name]
+        total = len(db.entries)
+        start, stop = (0, total) if limit is None else ((page - 1) * limit, min(page * limit, total))
+        if start < total or total == 0:
+            self.display_db_as_table(db, start, stop)
+        self.print_page_footer(start, stop, total, page, 'entries in this folder')
+
+    def list_all(self, options: list[str]) -> None:
+        # pages over the entries of all folders as one sequence; folders outside the page are not even decoded
+        if not self.databases:
+            self.cns.print('[red]Empty list of folders')
+            return
+        paging = self.parse_page(options)
+        if paging is None:
+            return
+        page, limit = paging
+        summaries = list(self.databases.summaries())
+        total = sum(entries for _, _, entries in summaries)
+        start, stop = (0, total) if limit is None else ((page - 1) * limit, min(page * limit, total))
+        offset = 0
+        for db_name, _, entries in summaries:
+            if entries:
+                on_page = offset < stop and offset + entries > start
+            else: # empty folders go on the page of the entries that follow them (or on the last page)
+                on_page = start <= offset < stop or offset == total == stop
+            if on_page:
+                self.display_db_as_table(self.databases[db_name], max(start - offset, 0), stop - offset)
+            offset += entries
+        self.print_page_footer(start, stop, total, page, 'entries in the storage')
     
+    def run_command(self, cmd: str) -> None:
+        # executes a command, recording its latency and profiling it after "profile on"
+        if not cmd.strip():
+            return
+        with self.lock:
+            start = time.perf_counter()
+            report = self.profiler.run(self.execute, cmd)
+            self.command_stats.record(instrument.command_name(cmd, COMMANDS, FOLDER_COMMANDS), time.perf_counter() - start)
+        if report is not None:
+            print(report)
+
+    def show_stats(self) -> None:
+        rows = []
+        for name, hist in sorted(self.command_stats.histograms.items()):
+            rows.append([
+                name, str(hist.count), f'{hist.total / hist.count * 1000:.2f}', f'{hist.max * 1000:.2f}',
+                ' '.join(f'{label}:{n}' for label, n in hist.buckets())
+            ])
+        if rows:
+            self.cns.print(ru.get_rich_table(
+                ['Command', 'Count', 'Mean ms', 'Max ms', 'Histogram'], rows, 'Command latency'
+            ))
+        else:
+            self.cns.print('[yellow]No commands recorded yet')
+        counters = crypt_tools.counters
+        rows = [
+            [direction, str(counters.calls[direction]), str(counters.strings[direction]), str(counters.chars[direction])]
+            for direction in ('encrypt', 'decrypt')
+        ]
+        self.cns.print(ru.get_rich_table(['', 'Calls', 'Strings', 'Characters'], rows, 'Cifer work'))
+        self.cns.print(f'Keystreams built: [blue]{counters.keystreams}[/], Vigenere passes over a string: [blue]{counters.passes}')
+        for name, cache in (('Keystream', crypt_tools.keystream_cache), ('Result', crypt_tools.result_cache)):
+            self.cns.print(
+                f'{name} cache: [blue]{cache.hits}[/] hits, [blue]{cache.misses}[/] misses, '
+                f'[blue]{len(cache.items)}[/] of {cache.maxsize} items'
+            )
+
     def execute(self, cmd: str) -> None:
         if not cmd:
             return
@@ -243,32 +1162,161 @@ class App:
                 )
                 self.cns.print(help_rich_table)
                 self.cns.print('[yellow]Note[/]: some commands have a short form: folder = f, lock = l, unlock = ul.')
-            case ['listv']:
-                if not self.databases:
-                    self.cns.print('[red]Empty list of folders')
+            case ['listv', *options]:
+                self.list_all(options)
+            case ['find', query]:
+                self.databases.decode_all()
+                found = sorted(self.databases.search_index.search(query), key=lambda fe: (fe[0].name, fe[1].name))
+                if not found:
+                    self.cns.print(f'[yellow]Nothing found for [white]{query}')
+                    return
+                rows = [
+                    [f'[cyan]{folder.name}[/]', entry.name, entry.login if folder.get_unlocked() else '[yellow]LOCKED[/]']
+                    for folder, entry in found
+                ]
+                self.cns.print(ru.get_rich_table(['Folder', 'Name', 'Login'], rows, f'Found {len(found)}'))
+            case ['find', query, '--all']:
+                rows = []
+                for name, opened in self.storages.items():
+                    opened.databases.decode_all()
+                    found = sorted(opened.databases.search_index.search(query), key=lambda fe: (fe[0].name, fe[1].name))
+                    rows.extend(
+                        [f'[magenta]{name}[/]', f'[cyan]{folder.name}[/]', entry.name,
+                         entry.login if folder.get_unlocked() else '[yellow]LOCKED[/]']
+                        for folder, entry in found
+                    )
+                if not rows:
+                    self.cns.print(f'[yellow]Nothing found for [white]{query}[/] in {len(self.storages)} open storage(s)')
+                    return
+                self.cns.print(ru.get_rich_table(['Storage', 'Folder', 'Name', 'Login'], rows, f'Found {len(rows)}'))
+            case ['open', *paths] if paths:
+                self.open_storages(paths)
+            case ['use', name]:
+                name = get_storage_name(name)
+                if name not in self.storages:
+                    self.cns.print(f'[red]Storage [magenta]{name}[/] is not open; try "open {name}"')
+                    return
+                self.use_storage(name)
+                self.cns.print(f'[green]Using storage [magenta]{name}')
+            case ['storages']:
+                self.show_storages()
+            case ['logkeep']:
+                # the policy is stored in every folder, so this (like setting it) reads all of them
+                keep = {(db.log_history.keep_last, db.log_history.keep_days) for db in self.databases.values()}
+                if len(keep) > 1:
+                    self.cns.print('[yellow]Folders keep different amounts of log history')
+                    return
+                keep_last, keep_days = keep.pop() if keep else (None, None)
+                if keep_last is not None:
+                    self.cns.print(f'Keeping the last [blue]{keep_last}[/] log records')
+                elif keep_days is not None:
+                    self.cns.print(f'Keeping the log records of the last [blue]{keep_days:g}[/] days')
+                else:
+                    self.cns.print('Keeping the whole log history')
+            case ['logkeep', amount]:
+                keep_last, keep_days = None, None
+                try:
+                    if amount.endswith('d'):
+                        keep_days = float(amount[:-1])
+                    elif amount != 'off':
+                        keep_last = int(amount)
+                except ValueError:
+                    self.cns.print(f'[red]{amount} is not a number of records or days')
                     return
-                for db_name, db in self.databases.items():
-                    self.display_db_as_table(db)
+                if (keep_last is not None and keep_last < 0) or (keep_days is not None and keep_days < 0):
+                    self.cns.print('[red]Amount of log history cannot be negative')
+                    return
+                for db in self.databases.values():
+                    db.set_log_retention(keep_last, keep_days)
+                self.cns.print('[green]Updated log retention of all folders')
+            case ['export', *options]:
+                self.export(list(self.databases), options, default_name=self.DBFILE[:-5])
             case ['list']:
                 if self.databases:
-                    table = ru.get_rich_dbs_short_table(self.databases.values())
+                    table = ru.get_rich_dbs_short_table(self.databases.summaries())
                     self.cns.print(table)
                 else:
                     self.cns.print('[red]Empty list of folders')
+            case ['list', '--all']:
+                for name, opened in self.storages.items():
+                    if opened.databases:
+                        self.cns.print(ru.get_rich_dbs_short_table(opened.databases.summaries(), f'Folders of {name}'))
+                    else:
+                        self.cns.print(f'[red]Empty list of folders in [magenta]{name}')
             case ['lock' | 'l', key]:
+                crypted = self.crypt_parallel(key, decrypt=False)
                 for foldername in self.databases:
-                    self.encrypt_db(foldername, key)
+                    self.encrypt_db(foldername, key, crypted.get(foldername))
             case ['lock' | 'l']:
                 if self.default_key is None:
                     self.cns.print('[red]"unlock <key>" command was not used')
                     return
+                crypted = self.crypt_parallel(self.default_key, decrypt=False)
                 for foldername in self.databases:
-                    self.encrypt_db(foldername, self.default_key)
+                    self.encrypt_db(foldername, self.default_key, crypted.get(foldername))
                 self.cns.print('[green]Locked everything with the key used in the last "unlock <key>"')
             case ['unlock' | 'ul', key]:
+                crypted = self.crypt_parallel(key, decrypt=True)
                 for foldername in self.databases:
-                    self.decrypt_db(foldername, key)
+                    self.decrypt_db(foldername, key, crypted.get(foldername))
                 self.default_key = key
+            case ['lazy']:
+                self.cns.print(f'Lazy unlock is [blue]{"on" if self.lazy_unlock else "off"}')
+            case ['lazy', 'on' | 'off' as mode]:
+                self.lazy_unlock = mode == 'on'
+                self.cns.print(f'[green]Lazy unlock is [blue]{mode}')
+            case ['autosave']:
+                if self.autosave_interval is None:
+                    self.cns.print('Autosave is [blue]off')
+                else:
+                    self.cns.print(f'Autosave every [blue]{self.autosave_interval:g}[/] seconds')
+            case ['autosave', 'off']:
+                self.set_autosave(None)
+                self.cns.print('[green]Autosave is [blue]off')
+            case ['autosave', seconds]:
+                try:
+                    seconds_float = float(seconds)
+                except ValueError:
+                    self.cns.print(f'[red]{seconds} is not a number')
+                    return
+                if seconds_float <= 0:
+                    self.cns.print('[red]Autosave interval must be positive')
+                    return
+                self.set_autosave(seconds_float)
+                self.cns.print(f'[green]Autosave every [blue]{seconds_float:g}[/] seconds')
+            case ['compress']:
+                level = self.storage.level if self.storage.level is not None else storage.DEFAULT_LEVELS.get(self.storage.codec)
+                if self.storage.codec == 'none':
+                    self.cns.print('The storage is [blue]not compressed')
+                else:
+                    self.cns.print(f'The storage is compressed with [blue]{self.storage.codec}[/] (level [blue]{level}[/])')
+            case ['compress', 'off' | 'zlib' | 'lzma' as codec, *level]:
+                codec = 'none' if codec == 'off' else codec
+                level_int = None
+                if level:
+                    try:
+                        level_int = int(level[0])
+                    except ValueError:
+                        self.cns.print(f'[red]{level[0]} is not an integer')
+                        return
+                    if codec == 'none' or level_int not in storage.CODEC_LEVELS[codec]:
+                        self.cns.print('[red]Level must be in 0..9 and needs a codec')
+                        return
+                self.storage.set_codec(codec, level_int)
+                self.cns.print(f'[green]The next save rewrites the storage {"uncompressed" if codec == "none" else "with [blue]" + codec}')
+            case ['workers']:
+                self.cns.print(f'Using [blue]{self.workers}[/] worker process(es)')
+            case ['workers', num]:
+                try:
+                    num_int = int(num)
+                except ValueError:
+                    self.cns.print(f'[red]{num} is not an integer')
+                    return
+                if num_int <= 0:
+                    self.cns.print('[red]Number of workers must be positive')
+                    return
+                self.workers = num_int
+                self.cns.print(f'[green]Using [blue]{num_int}[/] worker process(es)')
             case ['folder' | 'f', db_name, *rest]:
                 if db_name in self.databases:
                     match rest:
@@ -278,43 +1326,103 @@ class App:
                                 self.cns.print(feedback)
                             else:
                                 self.cns.print('[red]Not enough arguments for an entry')
-                        case ['list' | 'l']:
-                            self.display_db_as_table(self.databases[db_name])
+                        case ['list' | 'l', *options]:
+                            self.list_folder(db_name, options)
                         case ['drop']:
                             if self.databases[db_name].get_unlocked():
-                                if ru.input(self.cns, '[yellow]Are you sure ([green]y[/]/[red]n[/])? ') == 'y':
+                                if self.confirm('[yellow]Are you sure ([green]y[/]/[red]n[/])? '):
                                     del self.databases[db_name]
                                     self.cns.print(f'[green]Deleted folder [cyan]{db_name}')
                             else:
                                 self.cns.print('[red]Cannot delete a locked folder')
-                        case ['drop', entry_index]:
-                            try:
-                                entry_index_int = int(entry_index)
-                            except ValueError:
-                                self.cns.print(f'[red]{entry_index} is not an integer')
+                        case ['get', *refs] if refs:
+                            thisdb = self.databases[db_name]
+                            ids, missing = thisdb.find_ids(refs)
+                            for ref in missing:
+                                self.cns.print(f'[red]No entry [white]{ref}[/] in folder [cyan]{db_name}')
+                            if ids:
+                                entries = [(entry_id, thisdb.entries.get(entry_id)) for entry_id in ids]
+                                rows = [[str(entry_id), e.name, e.login, e.password, e.note] for entry_id, e in entries]
+                                self.cns.print(ru.get_rich_db_table(rows, thisdb.to_rich()))
+                        case ['drop', *refs]:
+                            thisdb = self.databases[db_name]
+                            if not thisdb.get_unlocked():
+                                self.cns.print('[red]Cannot delete an entry from a locked folder')
                                 return
-                            if self.databases[db_name].get_unlocked():
-                                feedback = self.databases[db_name].delete_entry(entry_index_int)
-                                self.cns.print(feedback)
+                            ids, missing = thisdb.find_ids(refs)
+                            for ref in missing:
+                                self.cns.print(f'[red]No entry [white]{ref}[/] in folder [cyan]{db_name}')
+                            if not ids:
+                                return
+                            names = thisdb.delete_entries(ids)
+                            if len(names) == 1:
+                                self.cns.print(f'[green]Deleted entry [white]{names[0]}[/] from folder [cyan]{db_name}')
                             else:
-                                self.cns.print('[red]Cannot delete an entry from a locked folder')
+                                self.cns.print(f'[green]Deleted [white]{len(names)}[/] entries from folder [cyan]{db_name}')
                         case ['lock' | 'l' | '<<', pin]:
                             self.encrypt_db(db_name, pin)
                         case ['unlock' | 'ul' | '>>', pin]:
                             self.decrypt_db(db_name, pin)
-                        case ['export']:
-                            filename = f'{db_name}.txt'
-                            with open(filename, 'w') as fexport:
-                                for ent in self.databases[db_name].entries:
-                                    print(ent, file=fexport)
-                        case ['info']:
-                            if self.databases[db_name].get_unlocked():
-                                for msg in self.databases[db_name].get_info():
-                                    self.cns.print(msg)
-                            else:
+                        case ['import', filename, *key]:
+                            self.import_entries(db_name, filename, key[0] if key else None)
+                        case ['export', *options]:
+                            self.export([db_name], options, default_name=db_name)
+                        case ['info', *options]:
+                            if not self.databases[db_name].get_unlocked():
                                 self.cns.print('[red]Cannot display info about a locked folder')
+                                return
+                            try:
+                                opts = utils.parse_options(options, {'since', 'limit', 'page'})
+                                since = datetime.fromisoformat(opts['since']) if 'since' in opts else None
+                                limit = int(opts['limit']) if 'limit' in opts else None
+                                page = int(opts.get('page', 1))
+                            except ValueError as e:
+                                self.cns.print(f'[red]{e}')
+                                return
+                            if limit is not None and (limit <= 0 or page <= 0):
+                                self.cns.print('[red]Limit and page must be positive')
+                                return
+                            lines = self.databases[db_name].iter_info(since)
+                            if limit is not None:
+                                lines = islice(lines, (page - 1) * limit, page * limit)
+                            for msg in lines:
+                                self.cns.print(msg)
                         case _:
                             self.cns.print('[red]Folder already exists')
+            case ['stats']:
+                self.show_stats()
+            case ['stats', 'reset']:
+                self.command_stats.reset()
+                crypt_tools.counters.reset()
+                for cache in (crypt_tools.keystream_cache, crypt_tools.result_cache):
+                    cache.hits = cache.misses = 0
+                self.cns.print('[green]Statistics cleared')
+            case ['profile']:
+                if self.profiler.remaining:
+                    self.cns.print(f'Profiling the next [blue]{self.profiler.remaining}[/] command(s)')
+                else:
+                    self.cns.print('Profiling is [blue]off')
+            case ['profile', 'off']:
+                self.profiler.stop()
+                self.cns.print('[green]Profiling is [blue]off')
+            case ['profile', 'on', *options]:
+                count = 1
+                if options and not options[0].startswith('--'):
+                    try:
+                        count = int(options.pop(0))
+                    except ValueError:
+                        self.cns.print('[red]Number of commands must be an integer')
+                        return
+                    if count <= 0:
+                        self.cns.print('[red]Number of commands must be positive')
+                        return
+                try:
+                    opts = utils.parse_options(options, {'out'})
+                except ValueError as e:
+                    self.cns.print(f'[red]{e}')
+                    return
+                self.profiler.start(count, opts.get('out'))
+                self.cns.print(f'[green]Profiling the next [blue]{count}[/] command(s)')
             case ['gen']:
                 self.cns.print(f'Generated password: {utils.generate_password(15)}')
             case ['gen', pass_len]:
@@ -334,6 +1442,19 @@ class App:
                         additional_str = ' (a huge one)'
 
                     self.cns.print(f'Generated password: {utils.generate_password(pass_len_int)}[blue]{additional_str}')
+            case ['gen', pass_len, count]:
+                try:
+                    pass_len_int, count_int = int(pass_len), int(count)
+                except ValueError:
+                    self.cns.print('[red]Length and count must be numbers')
+                    return
+                if pass_len_int <= 0 or count_int <= 0:
+                    self.cns.print('[red]Length and count must be positive')
+                    return
+                # one password per line, so that the output can be piped
+                print('\n'.join(utils.generate_passwords(pass_len_int, count_int)))
+            case ['audit', *options]:
+                self.audit(options)
             case ['allowed']:
                 print(''.join(utils.SYM_forw))
             case ['check', key]:
@@ -346,7 +1467,16 @@ class App:
             case _:
                 self.cns.print('[red]Unknown command. Try <help>')
 
+    def run_batch(self, commands: list[str]) -> None:
+        # runs the commands without any prompt and closes the app (saving once if any command asked for it)
+        for cmd in commands:
+            if not self.running:
+                return
+            self.run_command(cmd.strip())
+        if self.running:
+            self.close()
+
     def run(self) -> None:
         while self.running:
             cmd = ru.input(self.cns, '>>> ')
-            self.execute(cmd)
+            self.run_command(cmd)
@@ -1,45 +1,146 @@
-from rich.prompt import Prompt
-from rich.table import Table
-from rich.panel import Panel
+import builtins
+import re
+import sys
+
+# rich is only imported when the output is interactive; otherwise the tables and the console below are
+# replaced by their plain text counterparts (see use_plain_output)
+PLAIN = False
+MARKUP_RE = re.compile(r'\[(/?[a-z][a-z0-9 _#.]*|/)\]')
+
+
+def strip_markup(text: str) -> str:
+    return MARKUP_RE.sub('', text)
+
+
+class PlainTable:
+    # a table printed as tab separated lines, for scripts reading the output
+    def __init__(self, title: str, cols: list[str]) -> None:
+        self.title = title
+        self.cols = cols
+        self.rows: list[list[str]] = []
+
+    def add_row(self, *row: str) -> None:
+        self.rows.append([strip_markup(cell) for cell in row])
+
+    def add_raw_row(self, *row: str) -> None:
+        # for user data, which may contain brackets that look like markup
+        self.rows.append(list(row))
+
+    def __str__(self) -> str:
+        lines = [f'# {strip_markup(self.title)}'] if self.title else []
+        lines.append('\t'.join(strip_markup(col) for col in self.cols))
+        lines.extend('\t'.join(row) for row in self.rows)
+        return '\n'.join(lines)
+
+
+class PlainStatus:
+    def __enter__(self) -> 'PlainStatus':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def update(self, text: str) -> None:
+        pass
+
+
+class PlainConsole:
+    # stand-in for rich.console.Console when the output is not interactive
+    def print(self, *objects) -> None:
+        builtins.print(*(strip_markup(str(obj)) for obj in objects))
+
+    def status(self, text: str) -> PlainStatus:
+        return PlainStatus()
+
+
+def use_plain_output() -> None:
+    global PLAIN
+    PLAIN = True
+
+
+def get_console():
+    if PLAIN:
+        return PlainConsole()
+    from rich.console import Console
+    return Console()
+
 
 def input(console, prompt_text='>>> '):
+    if PLAIN:
+        return builtins.input(strip_markup(prompt_text))
+    from rich.prompt import Prompt
     return Prompt.get_input(console, prompt_text, False)
 
 
-def get_rich_db_table(rows: list[list[str]], title: str) -> Table:
-    table = Table(title=title, show_lines=True)
+def _table(title: str, show_lines: bool = False):
+    if PLAIN:
+        return PlainTable(title, [])
+    from rich.table import Table
+    return Table(title=title, show_lines=show_lines)
+
+
+def _add_column(table, header: str, **kwargs) -> None:
+    if PLAIN:
+        table.cols.append(header)
+    else:
+        table.add_column(header, **kwargs)
+
 
-    table.add_column("Name", justify="right", style="white bold", no_wrap=True)
-    table.add_column("Login", justify="right", style="green")
-    table.add_column("Password", justify="right", style="green")
-    table.add_column("Notes", justify="left", style="blue")
+DB_COLUMNS = ('ID', 'Name', 'Login', 'Password', 'Notes')
 
+
+def get_rich_db_table(rows: list[list[str]], title: str):
+    table = _table(title, show_lines=True)
+
+    _add_column(table, "ID", justify="right", style="blue", no_wrap=True)
+    _add_column(table, "Name", justify="right", style="white bold", no_wrap=True)
+    _add_column(table, "Login", justify="right", style="green")
+    _add_column(table, "Password", justify="right", style="green")
+    _add_column(table, "Notes", justify="left", style="blue")
+
+    if PLAIN:
+        for row in rows:
+            table.add_raw_row(*row)
+        return table
+    from rich.markup import escape
     for row in rows:
-        table.add_row(*row)
-    
+        table.add_row(*(escape(cell) for cell in row))
+
     return table
 
-def get_rich_dbs_short_table(databases) -> Table:
-    table = Table(title='Folders', show_lines=True)
-    table.add_column(' ')
-    table.add_column('Folder name')
-    table.add_column('# of entries')
 
-    for db in databases:
+def print_db_rows(title: str, chunks) -> None:
+    # plain output of entries without building a table: writes every chunk of rows as soon as it is decrypted
+    write = sys.stdout.write
+    write(f'# {strip_markup(title)}\n' + '\t'.join(DB_COLUMNS) + '\n')
+    for rows in chunks:
+        write(''.join('\t'.join(row) + '\n' for row in rows))
+
+def get_rich_dbs_short_table(summaries, title: str = 'Folders'):
+    # summaries: (name, unlocked, number of entries) of every folder
+    table = _table(title, show_lines=True)
+    _add_column(table, ' ')
+    _add_column(table, 'Folder name')
+    _add_column(table, '# of entries')
+
+    for name, unlocked, entries in summaries:
         table.add_row(
-            '[yellow]LOCKED[/]' if not db.get_unlocked() else '[green]OPEN[/]',
-            f'[cyan]{db.name}[/]',
-            f'{len(db.entries)}'
+            '[yellow]LOCKED[/]' if not unlocked else '[green]OPEN[/]',
+            f'[cyan]{name}[/]',
+            f'{entries}'
         )
     return table
 
 def get_rich_table(cols: list[str], rows: list[list[str]], title):
-    table = Table(title=title)
+    table = _table(title)
     for col in cols:
-        table.add_column(col)
+        _add_column(table, col)
     for row in rows:
         table.add_row(*row)
     return table
 
-def get_rich_panel(text: str) -> Panel:
-    return Panel(text)
\ No newline at end of file
+def get_rich_panel(text: str):
+    if PLAIN:
+        return text
+    from rich.panel import Panel
+    return Panel(text)
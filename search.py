@@ -0,0 +1,96 @@
+def trigrams(text: str) -> set[str]:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    # case-insensitive substring index over entry names of all decoded folders and logins of the unlocked ones;
+    # logins of a freshly unlocked folder are only indexed before the next search (so unlocking stays cheap)
+    # and are removed as soon as the folder is locked, so no ciphertext or locked plaintext is ever indexed
+    def __init__(self) -> None:
+        self.postings: dict[str, set[int]] = {} # trigram -> ids of the entries containing it
+        self.docs: dict[int, tuple] = {} # id(entry) -> (folder, entry, indexed lowercase texts)
+        self.pending_logins: dict[int, object] = {} # id(folder) -> unlocked folder whose logins are not indexed yet
+
+    def _set_texts(self, folder, entry, texts: list[str]) -> None:
+        doc_id = id(entry)
+        self._drop(doc_id)
+        self.docs[doc_id] = (folder, entry, texts)
+        for text in texts:
+            for tri in trigrams(text):
+                self.postings.setdefault(tri, set()).add(doc_id)
+
+    def _unindex(self, doc_id: int, tris: set[str]) -> None:
+        for tri in tris:
+            ids = self.postings.get(tri)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self.postings[tri]
+
+    def _drop(self, doc_id: int) -> None:
+        if doc_id not in self.docs:
+            return
+        for text in self.docs.pop(doc_id)[2]:
+            self._unindex(doc_id, trigrams(text))
+
+    def add_folder(self, folder) -> None:
+        folder.search_index = self
+        for entry in folder.entries:
+            self._set_texts(folder, entry, [entry.name.lower()])
+        if folder.get_unlocked():
+            self.pending_logins[id(folder)] = folder
+
+    def remove_folder(self, folder) -> None:
+        folder.search_index = None
+        self.pending_logins.pop(id(folder), None)
+        for entry in folder.entries:
+            self._drop(id(entry))
+
+    def add_entry(self, folder, entry) -> None:
+        texts = [entry.name.lower()]
+        if folder.get_unlocked() and id(folder) not in self.pending_logins:
+            texts.append(entry.login.lower())
+        self._set_texts(folder, entry, texts)
+
+    def remove_entry(self, entry) -> None:
+        self._drop(id(entry))
+
+    def folder_unlocked(self, folder) -> None:
+        self.pending_logins[id(folder)] = folder
+
+    def folder_locked(self, folder) -> None:
+        # only the logins have to go; a folder whose logins were never indexed has nothing to drop
+        if self.pending_logins.pop(id(folder), None) is not None:
+            return
+        for entry in folder.entries:
+            doc = self.docs.get(id(entry))
+            if doc is None or len(doc[2]) == 1:
+                continue
+            name, *logins = doc[2]
+            self.docs[id(entry)] = (folder, entry, [name])
+            # trigrams shared with the name still point at the entry
+            self._unindex(id(entry), set().union(*map(trigrams, logins)) - trigrams(name))
+
+    def _index_pending_logins(self) -> None:
+        for folder in self.pending_logins.values():
+            for entry, login in zip(folder.entries, folder.get_logins()):
+                self._set_texts(folder, entry, [entry.name.lower(), login.lower()])
+        self.pending_logins.clear()
+
+    def search(self, query: str) -> list[tuple]:
+        # (folder, entry) pairs whose name or login contains query
+        self._index_pending_logins()
+        query = query.lower()
+        if len(query) < 3:
+            candidates = self.docs.keys()
+        else:
+            posting_sets = sorted((self.postings.get(tri, set()) for tri in trigrams(query)), key=len)
+            if not posting_sets[0]:
+                return []
+            candidates = set.intersection(*posting_sets)
+        found = []
+        for doc_id in candidates:
+            folder, entry, texts = self.docs[doc_id]
+            if any(query in text for text in texts):
+                found.append((folder, entry))
+        return found
@@ -0,0 +1,458 @@
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+import lzma
+import mmap
+import os
+import pickle
+import threading
+import zlib
+
+from search import TrigramIndex
+
+
+COMPACT_MIN_BYTES = 64 * 1024 # journals smaller than this are never compacted
+MAGIC = b'PMSTORE1' # first bytes of an indexed snapshot; legacy snapshots are a bare pickle
+# the magic of an indexed snapshot also names the codec of its folder bodies (the header is never compressed)
+MAGICS = {b'PMSTORE1': 'none', b'PMSTOREZ': 'zlib', b'PMSTOREX': 'lzma'}
+CODEC_MAGICS = {codec: magic for magic, codec in MAGICS.items()}
+CODEC_LEVELS = {'zlib': range(0, 10), 'lzma': range(0, 10)}
+DEFAULT_LEVELS = {'zlib': 6, 'lzma': 6}
+
+
+def encode_body(codec: str, data: bytes, level: int | None = None) -> bytes:
+    if codec == 'zlib':
+        return zlib.compress(data, DEFAULT_LEVELS['zlib'] if level is None else level)
+    if codec == 'lzma':
+        return lzma.compress(data, preset=DEFAULT_LEVELS['lzma'] if level is None else level)
+    return data
+
+
+def decode_body(codec: str, data: bytes) -> bytes:
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    return data
+
+
+@dataclass
+class IndexRecord:
+    # header record of a folder that has not been decoded yet
+    name: str
+    offset: int # position of the pickled folder body, relative to the end of the header
+    length: int
+    entries: int
+    unlocked: bool
+    body: bytes | None = None # set once the snapshot is no longer mapped (see FolderIndex.detach)
+
+
+class FolderIndex(MutableMapping):
+    # dict of folders by name that decodes a folder body from the memory-mapped snapshot
+    # only when the folder is first accessed; `list` can be answered from the header alone.
+    # Decoded folders are kept registered in search_index.
+    def __init__(self, folders: dict | None = None) -> None:
+        self._folders: dict = dict(folders or {})
+        self.search_index = TrigramIndex()
+        for folder in self._folders.values():
+            self.search_index.add_folder(folder)
+        self._mm: mmap.mmap | None = None
+        self._body_start = 0
+        self.codec = 'none' # codec of the bodies of the undecoded folders
+        self.snapshot_id: str | None = None # journal batches of other snapshots are ignored
+        self.replaced: set[str] = set() # names assigned since the last save
+
+    @staticmethod
+    def open(path: str) -> 'FolderIndex':
+        with open(path, 'rb') as f:
+            codec = MAGICS.get(f.read(len(MAGIC)))
+            if codec is None:
+                f.seek(0)
+                return FolderIndex(pickle.load(f))
+            databases = FolderIndex()
+            databases.codec = codec
+            databases._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = databases._mm
+        header_len = int.from_bytes(mm[len(MAGIC):len(MAGIC)+8], 'little')
+        header_start = len(MAGIC) + 8
+        databases.snapshot_id, header = pickle.loads(mm[header_start:header_start+header_len])
+        databases._body_start = header_start + header_len
+        for rec in header:
+            databases._folders[rec[0]] = IndexRecord(*rec)
+        return databases
+
+    def detach(self) -> None:
+        # copies the bodies of undecoded folders out of the mapping and unmaps the snapshot,
+        # so that the file can be replaced by a new one
+        for rec in self._folders.values():
+            if isinstance(rec, IndexRecord) and rec.body is None:
+                rec.body = self.raw_body(rec.name)
+        self.close()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def raw_body(self, name: str) -> bytes | None:
+        # pickled body (encoded with self.codec) of an undecoded folder, None if the folder is already decoded
+        rec = self._folders[name]
+        if not isinstance(rec, IndexRecord):
+            return None
+        if rec.body is not None:
+            return rec.body
+        start = self._body_start + rec.offset
+        return self._mm[start:start+rec.length]
+
+    def __getitem__(self, name: str):
+        folder = self._folders[name]
+        if isinstance(folder, IndexRecord):
+            folder = pickle.loads(decode_body(self.codec, self.raw_body(name)))
+            self._folders[name] = folder
+            self.search_index.add_folder(folder)
+        return folder
+
+    def _unregister(self, name: str) -> None:
+        old = self._folders.get(name)
+        if old is not None and not isinstance(old, IndexRecord):
+            self.search_index.remove_folder(old)
+
+    def __setitem__(self, name: str, folder) -> None:
+        self._unregister(name)
+        self._folders[name] = folder
+        self.search_index.add_folder(folder)
+        self.replaced.add(name)
+
+    def __delitem__(self, name: str) -> None:
+        self._unregister(name)
+        del self._folders[name]
+        self.replaced.discard(name)
+
+    def __contains__(self, name) -> bool:
+        # the Mapping mixin would look the folder up, which decodes it
+        return name in self._folders
+
+    def __iter__(self):
+        return iter(self._folders)
+
+    def __len__(self) -> int:
+        return len(self._folders)
+
+    def decode_all(self) -> None:
+        # decodes every folder, e.g. so that all of them are registered in search_index
+        for name in self._folders:
+            self[name]
+
+    def loaded_items(self):
+        for name, folder in self._folders.items():
+            if not isinstance(folder, IndexRecord):
+                yield name, folder
+
+    def unlocked(self, name: str) -> bool:
+        # lock state of a folder without decoding it
+        folder = self._folders[name]
+        return folder.unlocked if isinstance(folder, IndexRecord) else folder.get_unlocked()
+
+    def summaries(self):
+        # (name, unlocked, number of entries) of every folder without decoding any of them
+        for name, folder in self._folders.items():
+            if isinstance(folder, IndexRecord):
+                yield name, folder.unlocked, folder.entries
+            else:
+                yield name, folder.get_unlocked(), len(folder.entries)
+
+
+def snapshot_parts(databases: FolderIndex) -> list[tuple]:
+    # what a snapshot needs from every folder, taken on the thread that requests the save:
+    # (name, entries, unlocked, body, frozen) with the encoded body of a folder that was never decoded
+    # or a frozen copy (see Folder.freeze) of a decoded one; the snapshot must already be detached
+    parts = []
+    for name, unlocked, entries in databases.summaries():
+        body = databases.raw_body(name)
+        parts.append((name, entries, unlocked, body, databases[name].freeze() if body is None else None))
+    return parts
+
+
+def snapshot_chunks(snapshot_id: str, parts: list[tuple], body_codec: str = 'none',
+                    codec: str = 'none', level: int | None = None) -> list[bytes]:
+    # magic of the codec, 8-byte header length, pickled (snapshot_id, [(name, offset, length, entries, unlocked), ...]),
+    # folder bodies (pickled, then compressed one by one, so that a folder is still decoded alone);
+    # body_codec is the codec of the bodies in parts
+    header, bodies, offset = [], [], 0
+    for name, entries, unlocked, body, frozen in parts:
+        if body is None:
+            body = encode_body(codec, pickle.dumps(frozen.thaw()), level)
+        elif body_codec != codec:
+            body = encode_body(codec, decode_body(body_codec, body), level)
+        header.append((name, offset, len(body), entries, unlocked))
+        bodies.append(body)
+        offset += len(body)
+    header_bytes = pickle.dumps((snapshot_id, header))
+    return [CODEC_MAGICS[codec], len(header_bytes).to_bytes(8, 'little'), header_bytes, *bodies]
+
+
+def write_atomic(path: str, chunks: list[bytes]) -> None:
+    # writes into a temporary file and renames it over path, so a crash never leaves a half-written file behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JournalStorage:
+    # storage backend: an indexed snapshot file (see snapshot_chunks; legacy .pass files are a bare pickled dict)
+    # plus an append-only journal of the changes made since the snapshot was written.
+    # Every save appends one pickled (snapshot_id, records) batch; records are (op, folder_name, payload) tuples:
+    #   ('put', name, Folder)     - the whole folder (new, replaced or encrypted/decrypted), frozen until it is pickled
+    #   ('drop', name, None)      - folder deleted
+    #   ('add', name, Entry)      - entry appended to the folder
+    #   ('delete_ids', name, ids) - entries deleted from the folder by ID
+    #   ('log', name, (timestamp, action, arg)) - log record appended to the folder
+    #   ('retention', name, (keep_last, keep_days)) - log retention policy of the folder changed
+    # Saving is split into prepare (only takes immutable copies of the changes on the calling thread) and write
+    # (pickles, compresses and writes them), so that everything but the copying can be left to a BackgroundSaver.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.known: set[str] | None = None # folder names as of the last load/save; None forces a full snapshot
+        self.codec = 'none' # codec of the snapshots written from now on (see set_codec); journals are not compressed
+        self.level: int | None = None
+        self.snapshot_size = 0
+        self.journal_size = 0
+
+    def load(self) -> FolderIndex:
+        databases = FolderIndex.open(self.path)
+        self.codec = databases.codec
+        self.snapshot_size = os.path.getsize(self.path)
+        self.journal_size = 0
+        for snapshot_id, batch in self._read_journal():
+            if snapshot_id != databases.snapshot_id:
+                # left over from before a compaction that was interrupted right after replacing the snapshot
+                continue
+            for op, name, payload in batch:
+                JournalStorage._replay(databases, op, name, payload)
+        if os.path.exists(self.journal_path):
+            self.journal_size = os.path.getsize(self.journal_path)
+        self._forget_changes(databases)
+        return databases
+
+    def _forget_changes(self, databases: FolderIndex) -> None:
+        for _, db in databases.loaded_items():
+            db.pop_changes()
+        databases.replaced.clear()
+        self.known = set(databases)
+
+    @staticmethod
+    def _replay(databases: FolderIndex, op: str, name: str, payload) -> None:
+        match op:
+            case 'put':
+                databases[name] = payload
+            case 'drop':
+                del databases[name]
+            case 'add':
+                folder = databases[name]
+                folder.entries.append(payload)
+                databases.search_index.add_entry(folder, payload)
+            case 'delete_ids':
+                entries = databases[name].entries
+                for entry_id in payload:
+                    databases.search_index.remove_entry(entries.pop(entry_id))
+            case 'log':
+                databases[name].log_history.append(*payload)
+            case 'retention':
+                databases[name].log_history.set_retention(*payload)
+
+    def _read_journal(self):
+        # yields the saved batches; a batch torn by a crash is cut off so that later appends stay readable
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r+b') as f:
+            good = 0
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    f.truncate(good)
+                    break
+                good = f.tell()
+                yield batch
+
+    def collect_changes(self, databases: FolderIndex) -> list[tuple]:
+        # folders that were never decoded cannot have changed, so only the loaded ones are looked at
+        records = []
+        for name in self.known:
+            if name not in databases:
+                records.append(('drop', name, None))
+        for name, db in databases.loaded_items():
+            changes = db.pop_changes()
+            if name in databases.replaced or changes is None:
+                records.append(('put', name, db.freeze()))
+            else:
+                records.extend((op, name, payload) for op, payload in changes)
+        return records
+
+    def prepare(self, databases: FolderIndex) -> tuple[str, list] | None:
+        # returns the write job for the current state: ('append', [(snapshot_id, records)]) for the journal,
+        # ('snapshot', snapshot_chunks arguments) for a compaction or None if nothing changed
+        if self.known is None or self._needs_compaction() or JournalStorage._any_locked(databases):
+            return 'snapshot', self.prepare_snapshot(databases)
+        records = self.collect_changes(databases)
+        databases.replaced.clear()
+        self.known = set(databases)
+        if not records:
+            return None
+        return 'append', [(databases.snapshot_id, records)]
+
+    def prepare_snapshot(self, databases: FolderIndex) -> tuple:
+        self._forget_changes(databases)
+        databases.snapshot_id = os.urandom(8).hex()
+        databases.detach()
+        return databases.snapshot_id, snapshot_parts(databases), databases.codec, self.codec, self.level
+
+    def write(self, job: tuple[str, list] | None) -> None:
+        # the sizes that decide on compaction are only known here, so they lag behind prepare by the queued jobs
+        if job is None:
+            return
+        kind, data = job
+        if kind == 'snapshot':
+            chunks = snapshot_chunks(*data)
+            write_atomic(self.path, chunks)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self.snapshot_size = sum(len(ch) for ch in chunks)
+            self.journal_size = 0
+            return
+        batches = [
+            pickle.dumps((snapshot_id, [(op, name, payload.thaw() if op == 'put' else payload) for op, name, payload in records]))
+            for snapshot_id, records in data
+        ]
+        with open(self.journal_path, 'ab') as f:
+            for batch in batches:
+                f.write(batch)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_size += sum(len(batch) for batch in batches)
+
+    def save(self, databases: FolderIndex) -> None:
+        self.write(self.prepare(databases))
+
+    def set_codec(self, codec: str, level: int | None = None) -> None:
+        # the next save writes a full snapshot with the new codec
+        self.codec = codec
+        self.level = level
+        self.known = None
+
+    @staticmethod
+    def _any_locked(databases: FolderIndex) -> bool:
+        # the journal (and the snapshot) may still hold the plaintext of a folder locked since the last save;
+        # only a new snapshot without a journal removes it from the disk
+        return any(db.locked_since_save for _, db in databases.loaded_items())
+
+    def _needs_compaction(self) -> bool:
+        return self.journal_size > COMPACT_MIN_BYTES and self.journal_size > self.snapshot_size
+
+    def compact(self, databases: FolderIndex) -> None:
+        # writes a full snapshot and starts an empty journal
+        self.write(('snapshot', self.prepare_snapshot(databases)))
+
+
+class BackgroundSaver:
+    # pickles, compresses and writes the jobs prepared by JournalStorage on a separate thread; jobs requested
+    # while the writer is busy are coalesced (journal appends are concatenated, a snapshot supersedes everything
+    # queued before it)
+    def __init__(self, storage: JournalStorage) -> None:
+        self.storage = storage
+        self.pending: list[tuple[str, list]] = []
+        self.busy = False
+        self.error: Exception | None = None
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def request(self, databases: FolderIndex) -> None:
+        job = self.storage.prepare(databases)
+        if job is None:
+            return
+        with self.cond:
+            if job[0] == 'snapshot':
+                self.pending = [job]
+            elif self.pending and self.pending[-1][0] == 'append':
+                self.pending[-1] = ('append', self.pending[-1][1] + job[1])
+            else:
+                self.pending.append(job)
+            self.cond.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                job = self.pending.pop(0)
+                self.busy = True
+            try:
+                self.storage.write(job)
+            except Exception as e:
+                with self.cond:
+                    self.error = e
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def pop_error(self) -> Exception | None:
+        with self.cond:
+            error, self.error = self.error, None
+            return error
+
+    def wait(self) -> None:
+        # blocks until every requested write is on disk
+        with self.cond:
+            while self.pending or self.busy:
+                self.cond.wait()
+
+    def close(self) -> None:
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+
+
+class AutosaveTimer:
+    # calls save every interval seconds on its own thread, also while the application is waiting for a command;
+    # an interval of None pauses it
+    def __init__(self, save) -> None:
+        self.save = save
+        self.interval: float | None = None
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def set_interval(self, interval: float | None) -> None:
+        # also restarts the countdown
+        with self.cond:
+            self.interval = interval
+            self.cond.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            with self.cond:
+                restarted = self.cond.wait(self.interval)
+                if not self.running:
+                    return
+                if restarted or self.interval is None:
+                    continue
+            self.save()
+
+    def close(self) -> None:
+        # does not wait for the thread, which may itself be waiting for the command that closes the application
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+import crypt_tools
+from crypt_tools import VigenereCipher, VigenereKeySplitCifer
+from utils import SYM_backw, SYM_forw, shift_str, string_repeater
+
+
+# the original pass-by-pass cifers; the keystream cifers must give exactly the same results
+def ref_vigenere(s: str, key: str, sign: int) -> str:
+    pr = string_repeater(key)
+    return ''.join(SYM_forw[(SYM_backw[ch] + sign * SYM_backw[next(pr)]) % len(SYM_forw)] for ch in s)
+
+
+def ref_iter_shift(s: str, key: str, iterations: int, sign: int) -> str:
+    order = range(iterations) if sign == 1 else reversed(range(iterations))
+    for i in order:
+        s = ref_vigenere(s, shift_str(key, i), sign)
+    return s
+
+
+def ref_key_split(s: str, key: str, iterations: int, sign: int) -> str:
+    keys = VigenereKeySplitCifer.split_key_2(key)
+    for k in (keys if sign == 1 else reversed(keys)):
+        s = ref_iter_shift(s, k, iterations, sign)
+    return s
+
+
+def reference(name: str, s: str, key: str, iterations: int, sign: int) -> str:
+    if name == 'VigenereCipher':
+        return ref_vigenere(s, key, sign)
+    if name == 'VigenereIterShiftCifer':
+        return ref_iter_shift(s, key, iterations, sign)
+    return ref_key_split(s, key, iterations, sign)
+
+
+def make_cifer(name: str, iterations: int):
+    if name == 'VigenereCipher':
+        return VigenereCipher()
+    return getattr(crypt_tools, name)(iterations=iterations)
+
+
+def random_text(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choices(SYM_forw, k=length))
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def batch_path(request, monkeypatch):
+    # runs a test with the vectorized batch path and with the pure python fallback
+    if request.param == 'numpy' and crypt_tools.load_numpy() is None:
+        pytest.skip('numpy is not installed')
+    if request.param == 'python':
+        monkeypatch.setattr(crypt_tools, 'USE_NUMPY', False)
+    crypt_tools.wipe_caches()
+    yield request.param
+    crypt_tools.wipe_caches()
+
+
+@pytest.mark.parametrize('name', ['VigenereCipher', 'VigenereIterShiftCifer', 'VigenereKeySplitCifer'])
+def test_keystream_matches_pass_by_pass(name, batch_path):
+    rng = random.Random(name)
+    for _ in range(40):
+        key = random_text(rng, rng.randint(1, 12))
+        iterations = rng.randint(1, 30)
+        strings = [random_text(rng, rng.randint(0, 40)) for _ in range(rng.randint(1, 8))]
+        cifer = make_cifer(name, iterations)
+        encrypted = [reference(name, s, key, iterations, 1) for s in strings]
+        assert [cifer.encrypt(s, key) for s in strings] == encrypted
+        assert [cifer.decrypt(s, key) for s in encrypted] == strings
+        crypt_tools.wipe_caches() # the batches must not just replay the results cached above
+        assert cifer.encrypt_batch(strings, key) == encrypted
+        assert cifer.decrypt_batch(encrypted, key) == strings
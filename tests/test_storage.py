@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+from obj import Entry, Folder
+from storage import FolderIndex, IndexRecord, JournalStorage
+
+
+def folder_state(folder: Folder) -> tuple:
+    # everything a reload has to restore: lock state, entries by ID and the log with its retention policy
+    entries = [(entry_id, e.name, e.login, e.password, e.note) for entry_id, e in folder.entries.items()]
+    log = folder.log_history
+    return folder.get_unlocked(), folder.entries.next_id, entries, folder.get_info(), log.keep_last, log.keep_days
+
+
+def storage_state(databases: FolderIndex) -> dict:
+    return {name: folder_state(databases[name]) for name in sorted(databases)}
+
+
+def journal_ops(storage: JournalStorage) -> set[str]:
+    return {op for _, records in storage._read_journal() for op, _, _ in records}
+
+
+def reload(path: str) -> tuple[JournalStorage, FolderIndex]:
+    storage = JournalStorage(path)
+    return storage, storage.load()
+
+
+@pytest.fixture
+def saved(tmp_path):
+    # a storage with three folders written as a snapshot without a journal
+    path = str(tmp_path / 'test.pass')
+    databases = FolderIndex()
+    for name in ('a', 'b', 'c'):
+        folder = Folder(name)
+        for i in range(5):
+            folder.add_entry(Entry(f'{name}{i}', f'login{i}', f'pass{i}', f'note {i}' if i % 2 else ''))
+        databases[name] = folder
+    storage = JournalStorage(path)
+    storage.save(databases)
+    assert not os.path.exists(storage.journal_path)
+    return path
+
+
+def test_journal_round_trip(saved):
+    storage, databases = reload(saved)
+    size = os.path.getsize(saved)
+    a = databases['a']
+    a.add_entry(Entry('new', 'login', 'pass'))
+    a.delete_entries(a.find_ids(['a1', 'a3'])[0])
+    databases['b'].set_log_retention(100, None)
+    del databases['c']
+    databases['d'] = Folder('d')
+    storage.save(databases)
+    assert os.path.getsize(saved) == size
+    assert journal_ops(storage) == {'add', 'delete_ids', 'log', 'retention', 'drop', 'put'}
+    expected = storage_state(databases)
+    assert storage_state(reload(saved)[1]) == expected
+
+    # after a compaction no folder is decoded on load (the journal replay decodes the folders it names),
+    # and a save of one folder does not decode the others
+    storage.compact(databases)
+    storage, databases = reload(saved)
+    assert not list(databases.loaded_items())
+    databases['a'].add_entry(Entry('more', 'login', 'pass'))
+    storage.save(databases)
+    assert journal_ops(storage) == {'add', 'log'}
+    assert [name for name, _ in databases.loaded_items()] == ['a']
+    expected['a'] = folder_state(databases['a'])
+    assert storage_state(reload(saved)[1]) == expected
+
+
+def test_torn_journal_tail(saved):
+    storage, databases = reload(saved)
+    databases['a'].add_entry(Entry('new', 'login', 'pass'))
+    storage.save(databases)
+    expected = storage_state(databases)
+    with open(storage.journal_path, 'ab') as f:
+        f.write(b'\x80\x04garbage') # a batch cut off by a crash
+    storage, databases = reload(saved)
+    assert storage_state(databases) == expected
+    # the torn batch is cut off, so the batches appended after it are read again
+    databases['b'].add_entry(Entry('after', 'login', 'pass'))
+    storage.save(databases)
+    expected = storage_state(databases)
+    assert storage_state(reload(saved)[1]) == expected
+
+
+def test_codec_switch(saved):
+    storage, databases = reload(saved)
+    databases['a'].add_entry(Entry('new', 'login', 'pass'))
+    storage.save(databases)
+    expected = storage_state(databases)
+    for codec, magic in (('zlib', b'PMSTOREZ'), ('lzma', b'PMSTOREX'), ('none', b'PMSTORE1')):
+        storage, databases = reload(saved)
+        storage.set_codec(codec)
+        storage.save(databases)
+        databases.close()
+        assert not os.path.exists(storage.journal_path)
+        with open(saved, 'rb') as f:
+            assert f.read(len(magic)) == magic
+        storage, databases = reload(saved)
+        assert databases.codec == codec
+        assert all(isinstance(folder, IndexRecord) for folder in databases._folders.values())
+        assert storage_state(databases) == expected
+        databases.close()
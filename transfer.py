@@ -0,0 +1,115 @@
+import csv
+import json
+from itertools import islice
+
+from utils import SYM_backw
+
+
+FIELDS = ('name', 'login', 'password', 'note')
+IMPORT_BATCH_SIZE = 5000
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = ('txt', 'csv', 'jsonl')
+
+
+def iter_records(path: str):
+    # streams (line number, record dict) from a .csv file with a header row or a .jsonl file;
+    # a line that is not valid JSON is streamed as None, so that it is reported like any other bad record
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif path.endswith('.jsonl'):
+        with open(path) as f:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                yield line_num, record
+    else:
+        raise ValueError(f'Unknown format of {path}; use a .csv or .jsonl file')
+
+
+def batched(iterable, size: int):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _row_error(record: dict) -> str | None:
+    if not isinstance(record, dict):
+        return 'not a record'
+    missing = [f for f in FIELDS[:3] if not record.get(f)]
+    if missing:
+        return f'missing {", ".join(missing)}'
+    unknown = set(''.join(str(record.get(f) or '') for f in FIELDS[1:])) - SYM_backw.keys()
+    if unknown:
+        return f'unknown characters {"".join(sorted(unknown))}'
+    return None
+
+
+def iter_import_batches(path: str, batch_size: int = IMPORT_BATCH_SIZE):
+    # yields (rows, errors) per batch: rows are (name, login, password, note) tuples of the valid records,
+    # errors are (line number, reason) of the skipped ones. The characters of a whole batch are checked
+    # against SYM_backw at once; records are only checked one by one if the batch is not clean.
+    for batch in batched(iter_records(path), batch_size):
+        records = [record for _, record in batch]
+        clean = all(isinstance(r, dict) and r.get('name') and r.get('login') and r.get('password') for r in records)
+        clean = clean and set(''.join(
+            str(r.get(f) or '') for r in records for f in FIELDS[1:]
+        )) <= SYM_backw.keys()
+        if clean:
+            yield [tuple(str(r.get(f) or '') for f in FIELDS) for r in records], []
+            continue
+        rows, errors = [], []
+        for line_num, record in batch:
+            error = _row_error(record)
+            if error is None:
+                rows.append(tuple(str(record.get(f) or '') for f in FIELDS))
+            else:
+                errors.append((line_num, error))
+        yield rows, errors
+
+
+def _format_txt(folder_name: str, locked: bool, rows: list[tuple]) -> str:
+    # same lines as Entry.__str__
+    return ''.join(
+        f'{name} | {login} | {password}{" | " + note if note else ""}\n' for name, login, password, note in rows
+    )
+
+
+def _format_jsonl(folder_name: str, locked: bool, rows: list[tuple]) -> str:
+    return ''.join(
+        json.dumps({'folder': folder_name, 'locked': locked, **dict(zip(FIELDS, row))}) + '\n' for row in rows
+    )
+
+
+def export_folders(path: str, fmt: str, folders, progress=None, headings: bool = True) -> int:
+    # streams folders into a file and returns the number of exported entries;
+    # folders yields (folder name, locked, chunks), chunks yield lists of (name, login, password, note),
+    # and every chunk is formatted and written at once. progress(count) is called after each chunk.
+    # headings: start the entries of every folder with a [folder_name] line in the txt format
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown format {fmt}; use one of {", ".join(EXPORT_FORMATS)}')
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer is not None:
+            writer.writerow(('folder', 'locked', *FIELDS))
+        for folder_name, locked, chunks in folders:
+            if fmt == 'txt' and headings:
+                f.write(f'[{folder_name}]\n')
+            for rows in chunks:
+                if fmt == 'txt':
+                    f.write(_format_txt(folder_name, locked, rows))
+                elif fmt == 'jsonl':
+                    f.write(_format_jsonl(folder_name, locked, rows))
+                else:
+                    writer.writerows((folder_name, locked, *row) for row in rows)
+                count += len(rows)
+                if progress is not None:
+                    progress(count)
+    return count
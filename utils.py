@@ -1,7 +1,7 @@
 from string import ascii_letters, ascii_lowercase, ascii_uppercase
-from random import choices
 from math import sqrt
 import hashlib
+import os
 
 
 SYM_forw: list[str] = ['o', 'D', '+', '0', 'w', 's', '1', '8', '@', 'H', 't', 
@@ -29,34 +29,85 @@ def shift_str(s: str, num: int) -> str:
     return s[-num:] + s[:len(s)-num]
 
 
+PASSWORD_CHARS = ascii_letters + '0123456789-!_'
+# random bytes below _GEN_LIMIT map evenly onto PASSWORD_CHARS (byte % len); the rest is dropped
+_GEN_LIMIT = 256 - 256 % len(PASSWORD_CHARS)
+_GEN_TABLE = bytes(ord(PASSWORD_CHARS[b % len(PASSWORD_CHARS)]) for b in range(256))
+_GEN_DROP = bytes(range(_GEN_LIMIT, 256))
+
+
+def generate_passwords(length: int, count: int) -> list[str]:
+    # cuts count passwords out of one buffer of os.urandom bytes, mapped to characters with a translation table
+    need = length * count
+    chars = b''
+    while len(chars) < need:
+        missing = need - len(chars)
+        chars += os.urandom(missing + missing // 4 + 16).translate(_GEN_TABLE, _GEN_DROP)
+    text = chars[:need].decode('ascii')
+    return [text[i:i+length] for i in range(0, need, length)]
+
+
 def generate_password(length):
-    chars = ascii_letters + '0123456789-!_'
-    return ''.join(choices(chars, k=length))
+    return generate_passwords(length, 1)[0]
+
+
+def parse_options(args: list[str], allowed: set[str], flags: set[str] = frozenset()) -> dict[str, str | bool]:
+    # parses command options of the form ['--name', 'value', '--flag', ...]; flags take no value
+    opts = {}
+    args = iter(args)
+    for name in args:
+        if not name.startswith('--') or (name[2:] not in allowed and name[2:] not in flags):
+            allowed_str = ', '.join('--' + a for a in sorted(allowed | flags))
+            raise ValueError(f'Unknown option {name}; allowed: {allowed_str}')
+        if name[2:] in flags:
+            opts[name[2:]] = True
+            continue
+        value = next(args, None)
+        if value is None:
+            raise ValueError(f'Option {name} needs a value')
+        opts[name[2:]] = value
+    return opts
 
 
 def hashf(s: str):
     return hashlib.sha256(s.encode()).hexdigest()
 
-def check_reliable(key: str) -> float:
-    # checks if the key is a reliable password and returns a score from [0, 1]
-    if len(key) < 8:
-        return 0.0
-    LC = set(ascii_lowercase)
-    UC = set(ascii_uppercase)
-    lc_count, uc_count, spec_count = 0, 0, 0
-
-    for ch in key:
-        if ch in LC:
-            lc_count += 1
-        elif ch in UC:
-            uc_count += 1
-        elif ch in SYM_forw:
-            spec_count += 1
-        else:
-            raise KeyError(f'Character {ch} cannot be used as a key in this storage. Try the <allowed> command to see the list of allowed characters')
+# maps every character to its class for check_reliable: l(owercase), u(ppercase), s(pecial); unknown characters
+# are left as they are and found by comparing the counts with the length
+_CLASS_TABLE = str.maketrans(
+    {ch: 's' for ch in SYM_forw} | {ch: 'l' for ch in ascii_lowercase} | {ch: 'u' for ch in ascii_uppercase}
+)
+
+
+def _score(lc_count: int, uc_count: int, spec_count: int) -> float:
     score = sqrt((lc_count/14)**2 + (uc_count/10)**2 + (spec_count/8)**2)
     if not (lc_count and uc_count and spec_count):
         score = min(score, 0.8)
     return min(score, 1.0)
+
+
+def check_reliable(key: str) -> float:
+    # checks if the key is a reliable password and returns a score from [0, 1]
+    if len(key) < 8:
+        return 0.0
+    classes = key.translate(_CLASS_TABLE)
+    lc_count, uc_count, spec_count = classes.count('l'), classes.count('u'), classes.count('s')
+    if lc_count + uc_count + spec_count != len(key):
+        ch = next(ch for ch, cls in zip(key, classes) if cls not in 'lus')
+        raise KeyError(f'Character {ch} cannot be used as a key in this storage. Try the <allowed> command to see the list of allowed characters')
+    return _score(lc_count, uc_count, spec_count)
+
+
+def score_passwords(passwords: list[str]) -> list[float]:
+    # check_reliable for many passwords at once (translated as one string; fields never contain a newline);
+    # characters that cannot be in a key count as special ones
+    scores = []
+    for password, classes in zip(passwords, '\n'.join(passwords).translate(_CLASS_TABLE).split('\n')):
+        if len(password) < 8:
+            scores.append(0.0)
+            continue
+        lc_count, uc_count = classes.count('l'), classes.count('u')
+        scores.append(_score(lc_count, uc_count, len(password) - lc_count - uc_count))
+    return scores
     
 